@@ -1,8 +1,10 @@
 from simplenlg import NLGFactory, Realiser, Lexicon, Feature, Tense
-import nltk
-from nltk.corpus import brown
+import time
 from typing import List
 
+from corpusstats import NLGCorpusStats, load_nlg_stats
+from lrucache import LRUCache
+
 class SentenceObject:
     def __init__(self, verb, subject, object=None, compliments:List[str]=None):
         self.verb = verb
@@ -24,111 +26,48 @@ class SentenceObject:
         return key
 
 
+def spec_key(s: SentenceObject):
+    """Hashable identity of everything a sentence is realised from."""
+    compliments = tuple(s.compliments) if s.compliments != None else ()
+    return (s.verb, s.subject, s.object, compliments)
+
+
 class NLGSentenceGenerator:
-    def __init__(self, decorate=True, decorate_compliments=True):
+    def __init__(self, decorate=True, decorate_compliments=True, stats:NLGCorpusStats=None, cache_size:int=10000):
+        """
+        stats : NLGCorpusStats
+            Brown corpus counts the determiners and prepositions are chosen
+            from, the cached load_nlg_stats() by default.
+        cache_size : int
+            Number of realised sentences kept across generate_batch calls.
+        """
         lexi = Lexicon.getDefaultLexicon()
         self.factory = NLGFactory(lexi)
         self.realiser = Realiser()
 
         self.decorate = decorate
         self.decorate_compliments = decorate_compliments
-
-    def most_used_by_key(self, key_prep_dict):
-        most_used_dict = dict()
-        if len(key_prep_dict) > 0:
-            sorted_choices = {k: v for k, v in sorted(key_prep_dict.items(), key=lambda item: item[1], reverse=True)}
-            for choice in sorted_choices:
-                splitted = choice.split("_")
-                key = splitted[0]
-                if key not in most_used_dict:
-                    most_used_dict[key] = ' '.join(splitted[1:])
-        return most_used_dict
+        self.stats = stats if stats is not None else load_nlg_stats()
+        self.cache = LRUCache(cache_size)
+        self.reset_timings()
 
     def get_trigram_preposition(self, target:str):
-        choices = dict()
-        for (p, d, n) in nltk.trigrams(brown.tagged_words(tagset="universal")):
-            if n[0] == target:
-                if n[1] == "NOUN" and d[1] == "DET" and p[1] == "ADP":
-                    k = p[0] + "_" + d[0]
-                    if k in choices:
-                        choices[k] += 1
-                    else:
-                        choices[k] = 1
-
-        most_used = ""
-        if len(choices) > 0:
-            sorted_choices = {k: v for k, v in sorted(choices.items(), key=lambda item: item[1])}
-            most_used = list(sorted_choices.keys())[-1]
-        return most_used
+        return self.stats.trigram_preposition(target)
 
     def get_multi_trigram_preposition(self, targetset:set):
-        choices = dict()
-        for (p, d, n) in nltk.trigrams(brown.tagged_words(tagset="universal")):
-            if n[0] in targetset:
-                if n[1] == "NOUN" and d[1] == "DET" and p[1] == "ADP":
-                    k = n[0] + "_" + p[0] + "_" + d[0]
-                    if k in choices:
-                        choices[k] += 1
-                    else:
-                        choices[k] = 1
-        return self.most_used_by_key(choices)
+        return self.stats.most_used_trigram_prepositions(targetset)
 
     def get_bigram_preposition(self, target:str):
-        choices = dict()
-        for (p, n) in nltk.bigrams(brown.tagged_words(tagset="universal")):
-            if n[0] == target:
-                if n[1] == "NOUN" and p[1] == "ADP":
-                    k = p[0]
-                    if k in choices:
-                        choices[k] += 1
-                    else:
-                        choices[k] = 1
-
-        most_used = ""
-        if len(choices) > 0:
-            sorted_choices = {k: v for k, v in sorted(choices.items(), key=lambda item: item[1])}
-            most_used = list(sorted_choices.keys())[-1]
-        return most_used
+        return self.stats.bigram_preposition(target)
 
     def get_multi_bigram_preposition(self, targetset:set):
-        choices = dict()
-        for (p, n) in nltk.bigrams(brown.tagged_words(tagset="universal")):
-            if n[0] in targetset:
-                if n[1] == "NOUN" and p[1] == "ADP":
-                    k = n[0] + "_" + p[0]
-                    if k in choices:
-                        choices[k] += 1
-                    else:
-                        choices[k] = 1
-
-        return self.most_used_by_key(choices)
+        return self.stats.most_used_bigram_prepositions(targetset)
 
     def get_determiner(self, target:str):
-        choices = dict()
-        for (d, n) in nltk.bigrams(brown.tagged_words(tagset="universal")):
-            if n[0] == target and d[1] == "DET":
-                k = d[0]
-                if k in choices:
-                    choices[k] += 1
-                else:
-                    choices[k] = 1
-        most_used = ""
-        if len(choices) > 0:
-            sorted_choices = {k: v for k, v in sorted(choices.items(), key=lambda item: item[1])}
-            most_used = list(sorted_choices.keys())[-1]
-        return most_used
+        return self.stats.determiner(target)
 
     def get_determiner_multi(self, targetset:set):
-        choices = dict()
-        for (d, n) in nltk.bigrams(brown.tagged_words(tagset="universal")):
-            if n[0] in targetset:
-                if d[1] == "DET":
-                    k = n[0] + "_"+ d[0]
-                    if k in choices:
-                        choices[k] += 1
-                    else:
-                        choices[k] = 1
-        return self.most_used_by_key(choices)
+        return self.stats.most_used_determiners(targetset)
 
     def get_decorated_word(self, word:str):
         pre = ""
@@ -164,50 +103,86 @@ class NLGSentenceGenerator:
         output = self.realiser.realiseSentence(p)
         return output
 
-    def generate_batch(self, sentences: List[SentenceObject], keyed=False):
-        determiners = set()
-        compliments = set()
-
-        for s in sentences:
-            determiners.add(s.subject)
-            determiners.add(s.object)
-            if s.compliments != None and len(s.compliments) > 0:
-                for comp in s.compliments:
-                    compliments.add(comp)
-
-        sub_prepos = self.get_determiner_multi(determiners)
-        sub_complements = self.get_multi_trigram_preposition(compliments)
-
-        outputs = []
-        keyed_outputs = dict()
+    def build_clause(self, s: SentenceObject, determiners:dict, prepositions:dict):
+        p = self.factory.createClause()
+        p.setVerb(s.verb)
 
-        for s in sentences:
-            p = self.factory.createClause()
-            p.setVerb(s.verb)
+        if self.decorate and s.subject in determiners:
+            p.setSubject(determiners[s.subject] + " " + s.subject)
+        else:
+            p.setSubject(s.subject)
 
-            if self.decorate and s.subject in sub_prepos:
-                p.setSubject(sub_prepos[s.subject] + " " + s.subject)
+        if s.object != None:
+            if self.decorate and s.object in determiners:
+                p.setObject(determiners[s.object] + " " + s.object)
             else:
-                p.setSubject(s.subject)
+                p.setObject(s.object)
 
-            if s.object != None:
-                if self.decorate and s.object in sub_prepos:
-                    p.setObject(sub_prepos[s.object] + " " + s.object)
+        if s.compliments != None and len(s.compliments) > 0:
+            for comp in s.compliments:
+                if self.decorate_compliments and comp in prepositions:
+                    p.setComplement(prepositions[comp] + " " + comp)
                 else:
-                    p.setObject(s.object)
+                    p.setComplement(comp)
 
-            if s.compliments != None and len(s.compliments) > 0:
-                for comp in s.compliments:
-                    if self.decorate_compliments and comp in sub_complements:
-                        p.setComplement(sub_complements[comp] + " " + comp)
-                    else:
-                        p.setComplement(comp)
+        p.setFeature(Feature.TENSE, Tense.PRESENT)
+        p.setFeature(Feature.PROGRESSIVE, True)
+        return p
 
-            p.setFeature(Feature.TENSE, Tense.PRESENT)
-            p.setFeature(Feature.PROGRESSIVE, True)
+    def reset_timings(self):
+        self.timings = {"lookup": 0.0, "clause": 0.0, "realise": 0.0}
 
-            output = self.realiser.realiseSentence(p)
+    def generate_batch(self, sentences: List[SentenceObject], keyed=False):
+        """
+        Realises every sentence spec once: identical specs of the batch share
+        a single clause, and specs realised by earlier batches are served from
+        self.cache. The time spent choosing determiners and prepositions,
+        building clauses and realising them accumulates in self.timings.
+        """
+        realised = dict()
+        pending = dict()
+        for s in sentences:
+            key = spec_key(s)
+            if key in realised or key in pending:
+                continue
+            output = self.cache.get(key)
+            if output is None:
+                pending[key] = s
+            else:
+                realised[key] = output
+
+        if len(pending) > 0:
+            start = time.perf_counter()
+            determiners = set()
+            compliments = set()
+
+            for s in pending.values():
+                determiners.add(s.subject)
+                determiners.add(s.object)
+                if s.compliments != None and len(s.compliments) > 0:
+                    for comp in s.compliments:
+                        compliments.add(comp)
+
+            sub_prepos = self.get_determiner_multi(determiners)
+            sub_complements = self.get_multi_trigram_preposition(compliments)
+            self.timings["lookup"] += time.perf_counter() - start
+
+            for key, s in pending.items():
+                start = time.perf_counter()
+                p = self.build_clause(s, sub_prepos, sub_complements)
+                built = time.perf_counter()
+                output = self.realiser.realiseSentence(p)
+                self.timings["clause"] += built - start
+                self.timings["realise"] += time.perf_counter() - built
+
+                realised[key] = output
+                self.cache.put(key, output)
 
+        outputs = []
+        keyed_outputs = dict()
+
+        for s in sentences:
+            output = realised[spec_key(s)]
             outputs.append(output)
             keyed_outputs[s.ToString()] = output
 
@@ -6,6 +6,7 @@ import re
 import math
 
 from NLGSentenceGenerator import NLGSentenceGenerator, SentenceObject
+from wordnettable import load_wordnet_table
 
 
 class SWiGCaptions:
@@ -47,9 +48,14 @@ class SWiGCaptions:
                                                                                         noun) else "'{}'".format(noun)
 
     def processed_synset(self, noun):
-        syn = self.noun2synset(noun)
-        splitted = syn.split(".")
-        final = splitted[0]
+        final = None
+        if re.fullmatch(r'n[0-9]+', noun):
+            final = load_wordnet_table().synset_name(int(noun[1:]))
+
+        if final is None:
+            syn = self.noun2synset(noun)
+            splitted = syn.split(".")
+            final = splitted[0]
         final = final.replace("_", " ")
         return final
 
@@ -207,7 +213,7 @@ class SWiGCaptions:
             range_end = self.n_items
 
         for i in range(range_start, range_end):
-            key = self._itemkeys[i-1]
+            key = self._itemkeys[i]
             batch_data[key] = self._json[key]
 
         return self.process_batch_data(batch_data)
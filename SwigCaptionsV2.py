@@ -1,40 +1,43 @@
 import json
+import os
 import re
 from typing import List
 import math
 
-# seed the pseudorandom number generator
 import random
+from array import array
 
-import cv2
 from pathlib import Path
-from nltk.corpus import wordnet as wn
-import nltk
-from nltk.corpus import brown
 
-from rolemaps import SUBJECT_ROLES, AGENT_ROLES, OBJECT_ROLES, ROLE_PREPOSITION_MAP, PLURAL_NOUNS, VERB_FORM_MAPS
-
-DETERMINERS_LIST = ['a', 'an', 'the']
-
-def show_img(imgpath:Path, annotation:dict):
-    # read image
-    img = cv2.imread(str(imgpath))
-
-    result = img.copy()
-    boxes = annotation['bb']
-    for bkey in boxes:
-        b = boxes[bkey]
-        cv2.rectangle(result, (b[0], b[1]), (b[2], b[3]), (0, 0, 255), 2)
-
-    # show thresh and result
-    cv2.imshow("bounding_box", result)
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+from rolemaps import PLURAL_NOUNS, VERB_FORM_MAPS
+from corpusstats import CorpusStats, PLACE_PREPOSITIONS, load_corpus_stats
+from wordnettable import DEFAULT_WORDNET_FILE, load_wordnet_table, first_synset_hypernyms
+from jsonstream import JsonObjectIndex, iter_json_items
+from sentencetemplates import SentenceTemplates, SENTENCE_TEMPLATES
+from roleclassifier import RoleClassifier, RoleClass, PLACE_ROLE, OBJECT_LISTED, table_classifier
+from interning import InternTable, EncodedAnnotation
+from lrucache import LRUCache
+from captionwriter import write_atomic
+from manifest import file_digest
+from metrics import timed, count
+from visualize import show_img
+
+# bump whenever a change to the generator changes the produced captions
+GENERATOR_VERSION = "2.1"
+HYPERNYM_CACHE_SIZE = 20000
+DEFAULT_HYPERNYM_CACHE_FILE = Path("generated/cache/hypernyms.json")
+HYPERNYM_CACHE_VERSION = 1
 
 def noun2synset(noun, trim=False):
     if noun == '':
         return noun
 
+    if trim and re.fullmatch(r'n[0-9]+', noun):
+        name = load_wordnet_table().synset_name(int(noun[1:]))
+        if name is not None:
+            return name
+
+    from nltk.corpus import wordnet as wn
     synset = wn.synset_from_pos_and_offset(noun[0], int(noun[1:])).name() if re.match(r'n[0-9]*', noun) \
         else "'{}'".format(noun)
 
@@ -43,57 +46,193 @@ def noun2synset(noun, trim=False):
     else:
         return synset
 
+# hypernym candidates of the nouns seen by this process
+_hypernym_cache = LRUCache(HYPERNYM_CACHE_SIZE)
+# hypernyms looked up since the last take_hypernym_updates, None when not recorded
+_hypernym_updates = None
+
+def get_hypernym_cache():
+    return _hypernym_cache
+
+def set_hypernym_cache(cache:LRUCache):
+    """Replaces the hypernym cache of this process, e.g. with a warm copy from another one."""
+    global _hypernym_cache
+    _hypernym_cache = cache
+
+def noun_hypernyms(noun):
+    hypernyms = _hypernym_cache.get(noun)
+    if hypernyms is None:
+        hypernyms = load_wordnet_table().hypernyms(noun)
+        if hypernyms is None:
+            hypernyms = first_synset_hypernyms(noun)
+        # shared by every caller, so kept immutable
+        hypernyms = tuple(hypernyms)
+        _hypernym_cache.put(noun, hypernyms)
+        if _hypernym_updates is not None:
+            _hypernym_updates[noun] = hypernyms
+    return hypernyms
+
+def take_hypernym_updates():
+    """
+    Returns the hypernyms looked up since the previous call and records the
+    next ones, e.g. for a pool worker to send them back to the parent.
+    """
+    global _hypernym_updates
+    updates = _hypernym_updates if _hypernym_updates is not None else {}
+    _hypernym_updates = {}
+    return updates
+
+def merge_hypernyms(updates:dict):
+    for noun, hypernyms in updates.items():
+        if noun not in _hypernym_cache:
+            _hypernym_cache.put(noun, tuple(hypernyms))
+
+def _wordnet_digest():
+    load_wordnet_table()
+    return file_digest(DEFAULT_WORDNET_FILE)
+
+def load_hypernym_cache(path:Path=DEFAULT_HYPERNYM_CACHE_FILE):
+    """
+    Adds the hypernyms saved by a previous run to the cache, unless they were
+    looked up in another WordNet table. Returns the number of nouns added.
+    """
+    if not os.path.isfile(path):
+        return 0
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except ValueError:
+        return 0
+    if data.get("version") != HYPERNYM_CACHE_VERSION or data.get("wordnet") != _wordnet_digest():
+        return 0
+
+    merge_hypernyms(dict(data["entries"]))
+    return len(data["entries"])
+
+def save_hypernym_cache(path:Path=DEFAULT_HYPERNYM_CACHE_FILE):
+    path = Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    data = {
+        "version": HYPERNYM_CACHE_VERSION,
+        "wordnet": _wordnet_digest(),
+        # least recently used first, so loading keeps the recency order
+        "entries": [[noun, list(hypernyms)] for noun, hypernyms in _hypernym_cache.items()],
+    }
+    write_atomic(path, json.dumps(data))
+
+def image_rng(seed:int, img_key:str):
+    """
+    Random generator of a single image, derived from the run seed and the image
+    key so the captions do not depend on batching or processing order.
+    String seeds are hashed with sha512, which is stable across processes.
+    """
+    return random.Random("{}:{}".format(seed, img_key))
+
 def count_n_roles(annotation:dict):
     return len(annotation['bb'].keys())
 
+class SwigVocabulary:
+    """
+    Resolved nouns of a set of annotations: the formatted noun and determiner
+    of every noun id of table, and the preposition of every formatted noun,
+    keyed like SwigCaptionGenerator.
+    """
+    vocabs: dict
+    determiners: dict
+    prepositions: dict
+    table: InternTable
+
+    def __init__(self, vocabs:dict, determiners:dict, prepositions:dict, table:InternTable):
+        self.vocabs = vocabs
+        self.determiners = determiners
+        self.prepositions = prepositions
+        self.table = table
+
 class SwigCaptionGenerator:
+    """
+    Role names, nouns and verbs are handled as ids of an InternTable: frames
+    are kept as encoded arrays and vocabs, determiners, agentlist and
+    placelist are keyed by noun id.
+    """
     img_keys: List[str]
     annotations: dict
-    wn: wn
+    table: InternTable
+    frames: dict
+    verbs: dict
     imgdir: Path
     vocabs: dict
-    agent_roles: list
     agentlist: dict
     placelist: dict
     determiners: dict
     prepositions: dict
-    subject_roles: list
-    object_roles: list
+    role_classes: RoleClassifier
+    templates: SentenceTemplates
+    stats: CorpusStats
+    seed: int
+    rng: random.Random
     debug: bool
 
 
-    def __init__(self, annotations:dict,  debug:bool = False, img_dir: str = './SWiG/images_512'):
+    def __init__(self, annotations:dict,  debug:bool = False, img_dir: str = './SWiG/images_512', stats:CorpusStats = None,
+                 seed:int = 1, vocabulary:SwigVocabulary = None, keys:List[str] = None, table:InternTable = None):
+        """
+        annotations : dict
+            SWiG annotations or EncodedAnnotation of table, by image key
+        vocabulary : SwigVocabulary
+            Nouns resolved beforehand, e.g. for a full split with build_vocabulary.
+            When given only the per image agent and place lists are computed.
+        keys : List[str]
+            Image keys to generate captions for, all the annotations by default.
+            Allows passing a slice of a larger annotation dict without copying it.
+        table : InternTable
+            Ids to encode the annotations with, the table of vocabulary if given.
+        """
         self.annotations = annotations
-        self.img_keys = list(annotations.keys())
+        self.img_keys = list(keys) if keys is not None else list(annotations.keys())
         self.imgdir = Path(img_dir)
-        self.wn = wn
-        self.vocabs = {}
+
+        if vocabulary is not None:
+            table = vocabulary.table
+        self.table = table if table is not None else InternTable()
+        self.frames = {}
+        self.verbs = {}
 
         self.agentlist = {}
         self.placelist = {}
-        self.determiners = {}
-        self.prepositions = {}
+        if vocabulary is not None:
+            self.vocabs = vocabulary.vocabs
+            self.determiners = vocabulary.determiners
+            self.prepositions = vocabulary.prepositions
+        else:
+            self.vocabs = {}
+            self.determiners = {}
+            self.prepositions = {}
 
-        self.agent_roles = AGENT_ROLES
-        self.subject_roles = SUBJECT_ROLES
-        self.object_roles = OBJECT_ROLES
+        self._agent_role = self.table.roles.intern('agent')
+        self._place_role = self.table.roles.intern(PLACE_ROLE)
+        self.role_classes = table_classifier(self.table)
+        self.templates = SENTENCE_TEMPLATES
 
+        self.stats = stats if stats is not None else load_corpus_stats()
         self.debug = debug
 
-        random.seed(1)
-        self.preprocess_frames()
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.preprocess_frames(resolve_vocabulary=vocabulary is None)
+
+    @property
+    def wn(self):
+        # nltk is only imported when wordnet is used directly, the nouns are
+        # looked up in the wordnet table
+        from nltk.corpus import wordnet
+        return wordnet
 
     def check_synonym(self, noun):
-        synlist = wn.synsets(noun)
+        hypnyms = noun_hypernyms(noun)
 
-        if len(synlist) > 0:
-            hypnyms = synlist[0].hypernyms()
-            if len(hypnyms) > 0:
-                randidx = random.randint(1, len(hypnyms))
-                name = hypnyms[randidx-1].name()
-                noun = name.split('.')[0]
-                noun = noun.replace("_", " ")
-                return noun
+        if len(hypnyms) > 0:
+            randidx = self.rng.randint(1, len(hypnyms))
+            return hypnyms[randidx-1]
 
         return noun
 
@@ -105,12 +244,15 @@ class SwigCaptionGenerator:
         noun = noun.lower()
         return noun
 
-    def remove_empty_roles(self, roles: dict):
-        trimmed = dict()
-        for r in roles:
-            if roles[r] != '':
-                trimmed[r] = roles[r]
-        return trimmed
+    def remove_empty_roles(self, frame: array):
+        """Splits an encoded frame into the role and noun ids of its non empty values."""
+        roles = []
+        nouns = []
+        for i in range(0, len(frame), 2):
+            if frame[i + 1] >= 0:
+                roles.append(frame[i])
+                nouns.append(frame[i + 1])
+        return roles, nouns
 
     def bb_list_to_dict(self, bblist:List):
         """
@@ -123,32 +265,47 @@ class SwigCaptionGenerator:
             'x1': bblist[0], 'x2': bblist[2], 'y1': bblist[1], 'y2': bblist[3],
         }
 
-    def preprocess_frames(self):
-
-        all_agents = []
-        all_places = []
-
-        for key in self.img_keys:
-            annotation = self.annotations[key]
-            frames = annotation['frames']
-            agentlist = []
-            placelist = []
-            for f in frames:
-                for role in f:
-                    roleval = f[role]
-                    if roleval != '':
-                        if roleval not in self.vocabs:
-                            self.vocabs[roleval] = self.format_noun(roleval)
-                        if role in self.agent_roles:
-                            agentlist.append(roleval)
-                            if roleval not in all_agents:
-                                all_agents.append(roleval)
-                        if role == 'place':
-                            placelist.append(roleval)
-                            if roleval not in all_places:
-                                all_places.append(roleval)
-            self.agentlist[key] = agentlist
-            self.placelist[key] = placelist
+    def get_vocabulary(self):
+        return SwigVocabulary(self.vocabs, self.determiners, self.prepositions, self.table)
+
+    def encode(self, annotation):
+        if isinstance(annotation, EncodedAnnotation):
+            return annotation
+        return self.table.encode_annotation(annotation)
+
+    def preprocess_frames(self, resolve_vocabulary:bool = True):
+
+        all_agents = set()
+        all_places = set()
+
+        nouns = self.table.nouns.strings
+        classes = self.role_classes
+
+        with timed("vocabulary", items=len(self.img_keys)):
+            for key in self.img_keys:
+                annotation = self.encode(self.annotations[key])
+                classes.extend()
+                self.frames[key] = annotation.frames
+                self.verbs[key] = self.table.verbs.strings[annotation.verb]
+                agentlist = []
+                placelist = []
+                for f in annotation.frames:
+                    for i in range(0, len(f), 2):
+                        role, roleval = f[i], f[i + 1]
+                        if roleval >= 0:
+                            if resolve_vocabulary and roleval not in self.vocabs:
+                                self.vocabs[roleval] = self.format_noun(nouns[roleval])
+                            if classes[role].is_agent:
+                                agentlist.append(roleval)
+                                all_agents.add(roleval)
+                            if role == self._place_role:
+                                placelist.append(roleval)
+                                all_places.add(roleval)
+                self.agentlist[key] = agentlist
+                self.placelist[key] = placelist
+
+        if not resolve_vocabulary:
+            return
 
         targets = [self.vocabs[v] for v in self.vocabs if len(self.vocabs[v].split()) == 1]
         targets = set(targets)
@@ -166,7 +323,7 @@ class SwigCaptionGenerator:
 
         places = [self.vocabs[p] for p in all_places]
         places = set(places)
-        place_preps = self.compute_trigram_preposition(places, preplist=['at', 'in', 'on'])
+        place_preps = self.compute_trigram_preposition(places, preplist=PLACE_PREPOSITIONS)
         for p in place_preps:
             self.prepositions[p] = place_preps[p]
 
@@ -186,113 +343,44 @@ class SwigCaptionGenerator:
             print(self.placelist)
 
 
-    def most_used_by_key(self, key_prep_dict):
-        most_used_dict = dict()
-        if len(key_prep_dict) > 0:
-            sorted_choices = {k: v for k, v in sorted(key_prep_dict.items(), key=lambda item: item[1], reverse=True)}
-            for choice in sorted_choices:
-                splitted = choice.split("_")
-                key = splitted[0]
-                if key not in most_used_dict:
-                    most_used_dict[key] = ' '.join(splitted[1:])
-        return most_used_dict
-
     def compute_vocab_determiners(self, targetset:set):
         if len(targetset) == 0:
             return {}
 
-        choices = dict()
-        for (d, n) in nltk.bigrams(brown.tagged_words(tagset="universal")):
-            if n[0].lower() in targetset:
-                if d[0].lower() in DETERMINERS_LIST:
-                    k = n[0].lower() + "_"+ d[0].lower()
-                    if k in choices:
-                        choices[k] += 1
-                    else:
-                        choices[k] = 1
-        return self.most_used_by_key(choices)
+        with timed("corpus_stats", items=len(targetset)):
+            return self.stats.most_used_determiners(targetset)
 
     def compute_trigram_preposition(self, targetset:set, preplist:List=None):
         if len(targetset) == 0:
             return {}
 
-        choices = dict()
-        for (p, d, n) in nltk.trigrams(brown.tagged_words(tagset="universal")):
-            if preplist:
-                if n[0].lower() in targetset and p[0].lower() in preplist:
-                    if d[1] == "DET" and p[1] == "ADP":
-                        k = n[0].lower() + "_" + p[0].lower()
-                        if k in choices:
-                            choices[k] += 1
-                        else:
-                            choices[k] = 1
-            else:
-                if n[0].lower() in targetset:
-                    if d[1] == "DET" and p[1] == "ADP":
-                        k = n[0].lower() + "_" + p[0].lower()
-                        if k in choices:
-                            choices[k] += 1
-                        else:
-                            choices[k] = 1
-        return self.most_used_by_key(choices)
-
-    def detect_subject_from_frame(self, frame:dict, annot_key:str):
-        all_keys:List[str] = list(frame.keys())
-        agentlist = self.agentlist[annot_key]
-
-        if len(all_keys) == 1:
-            if all_keys[0] == 'place':
-                if len(agentlist) > 0:
-                    return ('agent', agentlist[0])
-                else:
-                    return (None, None)
-            return (all_keys[0], frame[all_keys[0]])
+        with timed("corpus_stats", items=len(targetset)):
+            return self.stats.most_used_prepositions(targetset, preplist=preplist)
 
-        for k in all_keys:
-            if k in self.agent_roles:
-                return (k, frame[k] )
-
-        for k in all_keys:
-            if k in self.subject_roles:
-                return (k, frame[k] )
-
-        for k in all_keys:
-            if k.endswith("er") or k.endswith("ers"):
-                return (k, frame[k] )
-
-        for k in all_keys:
-            if k != 'place':
-                return (k, frame[k])
-
-    def detect_place_from_frame(self, frame: dict, ignore_keys:list, annot_key:str):
-        place_roles = ['place']
-        all_keys:List[str] = list(frame.keys())
-        all_keys = [k for k in all_keys if k not in ignore_keys]
-
-        placelist = self.placelist[annot_key]
-
-        for k in all_keys:
-            if k in place_roles:
-                return (k, frame[k])
-
-        if len(placelist) > 0:
-            return ('place', placelist[0])
-
-        return (None, None)
-
-    def detect_object_from_frame(self, frame: dict, ignore_keys:list):
-        all_keys:List[str] = list(frame.keys())
-        all_keys = [k for k in all_keys if k not in ignore_keys]
+    def select_roles(self, roles:List[int], nouns:List[int], annot_key:str):
+        """
+        Returns the (role, noun) ids of the subject, place and object of a
+        frame, (None, None) for the missing ones. An image level agent or
+        place stands in for the subject of a place only frame and for a
+        missing place.
+        """
+        if len(roles) == 1 and roles[0] == self._place_role:
+            agentlist = self.agentlist[annot_key]
+            subject = (self._agent_role, agentlist[0]) if len(agentlist) > 0 else (None, None)
+            place = (roles[0], nouns[0])
+            return subject, place, (None, None)
 
-        for k in all_keys:
-            if k in self.object_roles:
-                return (k, frame[k])
+        s, p, o = self.role_classes.select(roles)
 
-        for k in all_keys:
-            if k.endswith("item") or k.endswith("items"):
-                return (k, frame[k])
+        subject = (roles[s], nouns[s]) if s is not None else (None, None)
+        if p is not None:
+            place = (roles[p], nouns[p])
+        else:
+            placelist = self.placelist[annot_key]
+            place = (self._place_role, placelist[0]) if len(placelist) > 0 else (None, None)
+        obj = (roles[o], nouns[o]) if o is not None else (None, None)
 
-        return (None, None)
+        return subject, place, obj
 
     def get_place_phrase(self, place:tuple):
         base_place_phrase = self.determiners[place[1]] + " " + self.vocabs[place[1]]
@@ -303,123 +391,78 @@ class SwigCaptionGenerator:
 
         return 'at ' + base_place_phrase
 
-    def get_as_phrase(self, val:str, role: str, with_pp:bool=True):
+    def get_as_phrase(self, val:int, role_id:int, with_pp:bool=True):
         base_phrase = self.determiners[val] + " " + self.vocabs[val]
 
         if with_pp:
             if self.determiners[val] == 'the':
                 base_phrase = self.vocabs[val]
 
-            if role in ROLE_PREPOSITION_MAP:
-                if ROLE_PREPOSITION_MAP[role] != '':
-                    return ROLE_PREPOSITION_MAP[role] + " " + base_phrase
+            preposition = self.role_classes[role_id].preposition
+            if preposition is not None:
+                if preposition != '':
+                    return preposition + " " + base_phrase
                 else:
                     return base_phrase
 
             if self.debug:
-                print(role + ':' + self.vocabs[val])
+                print(self.table.roles.strings[role_id] + ':' + self.vocabs[val])
 
             if self.vocabs[val] in self.prepositions:
                 return self.prepositions[self.vocabs[val]] + " " + base_phrase
         else:
-            rand = random.random()
+            rand = self.rng.random()
             if rand > 0.75:
                 synval = self.check_synonym(self.vocabs[val])
                 base_phrase = self.determiners[val] + " " + synval
 
         return base_phrase
 
-    def is_plural(self, subject:str, subj_key:str=None):
+    def is_plural(self, subject:str, subj_class:RoleClass=None):
         noun = subject.split()[-1]
-        if subj_key and subj_key.endswith('s'):
+        if subj_class is not None and subj_class.plural:
             return True
         if noun in PLURAL_NOUNS:
             return True
         return False
 
-    def get_verb_phrase(self, annot_key: str, subj_val:str, subj_key:str):
-        if annot_key not in self.img_keys:
+    def get_verb_phrase(self, annot_key: str, subj_val:int, subj_key:int):
+        if annot_key not in self.verbs:
             raise Warning("Image key not available in provided annotations")
 
         is_plural = False
         if subj_val != None and subj_key != None:
-            is_plural = self.is_plural(self.vocabs[subj_val], subj_key)
-
-        annotation = self.annotations[annot_key]
-        verb = annotation['verb']
-
-        rand = random.random()
-        if verb in VERB_FORM_MAPS and rand > 0.3:
-            verb_forms = VERB_FORM_MAPS[verb]
-            if is_plural:
-                return verb_forms[0]
-            else:
-                return verb_forms[1]
-
-        if is_plural:
-            return 'are ' + verb
-        else:
-            return 'is ' + verb
-
-    def construct_passive_sentence(self, object_phrase:str, subject_phrase: str, annot_key:str):
-        annotation = self.annotations[annot_key]
-        verb = annotation['verb']
-
-        if verb not in VERB_FORM_MAPS:
-            raise ValueError("Verb not found")
+            is_plural = self.is_plural(self.vocabs[subj_val], self.role_classes[subj_key])
 
-        verb_forms = VERB_FORM_MAPS[verb]
-        verb_tense = verb_forms[0] + 'ed'
-        if verb_forms[0].endswith('e'):
-            verb_tense = verb_forms[0] + 'd'
-        verb_phrase = "getting " + verb_tense + ' by'
-
-        return object_phrase + " is " + verb_phrase + " " + subject_phrase
+        verb = self.verbs[annot_key]
 
+        rand = self.rng.random()
+        return self.templates.verb_phrase(verb, is_plural, rand > 0.3)
 
     def construct_sentence(self, subject:str, verb_phrase:str, object_phrase:str, compliments:List, place:str, annot_key:str):
+        verb = self.verbs[annot_key]
 
-        base_sentence = subject + " " + verb_phrase
-
+        passive = False
         if object_phrase != "":
-            annotation = self.annotations[annot_key]
-            verb = annotation['verb']
-            rand = random.random()
-            if verb in VERB_FORM_MAPS and rand > 0.75:
-                base_sentence = self.construct_passive_sentence(object_phrase, subject, annot_key)
-            else:
-                base_sentence = base_sentence + " " + object_phrase
-
-        if len(compliments) > 0:
-            compliment_phrases = " ".join(compliments)
-            base_sentence =  base_sentence + " " + compliment_phrases
+            rand = self.rng.random()
+            passive = verb in VERB_FORM_MAPS and rand > 0.75
 
-        if place != "":
-            base_sentence = base_sentence + " " + place
+        return self.templates.render(verb, verb_phrase, passive, subject, object_phrase, compliments, place)
 
-        return base_sentence
-
-    def process_frames(self, frame:dict, annot_key:str):
-        f = self.remove_empty_roles(frame)
+    def process_frames(self, frame:array, annot_key:str):
+        roles, nouns = self.remove_empty_roles(frame)
         ignored_keys = []
 
-        if len(f.keys()) == 0:
+        if len(roles) == 0:
             return ""
 
-        sub_key, sub_val = self.detect_subject_from_frame(f, annot_key)
-        if sub_key:
-            ignored_keys.append(sub_key)
-
-
-        place_key, place_val = self.detect_place_from_frame(f, ignored_keys, annot_key)
-        if place_key:
-            ignored_keys.append(place_key)
+        (sub_key, sub_val), (place_key, place_val), (object_key, object_val) = \
+            self.select_roles(roles, nouns, annot_key)
+        for k in (sub_key, place_key, object_key):
+            if k is not None:
+                ignored_keys.append(k)
 
-        object_key, object_val = self.detect_object_from_frame(f, ignored_keys)
-        if object_key:
-            ignored_keys.append(object_key)
-
-        if sub_val:
+        if sub_val is not None:
             subject_phrase = self.get_as_phrase(sub_val, sub_key, with_pp=False)
         else:
             subject_phrase = "it"
@@ -427,27 +470,28 @@ class SwigCaptionGenerator:
         verb_phrase = self.get_verb_phrase(annot_key, sub_val, sub_key)
 
         object_phrase = ""
-        if object_val:
+        if object_val is not None:
             object_phrase = self.get_as_phrase(object_val, object_key, with_pp=False)
 
-        compliments = [(k, f[k]) for k in f.keys() if k not in ignored_keys]
+        compliments = [(k, n) for k, n in zip(roles, nouns) if k not in ignored_keys]
         compliments_list = [self.get_as_phrase(n, k, with_pp=True) for k, n in compliments]
 
         place_phrase = ""
-        if place_val:
+        if place_val is not None:
             place_phrase = self.get_place_phrase((place_key, place_val))
 
         sentence = self.construct_sentence(subject_phrase, verb_phrase, object_phrase, compliments_list, place_phrase, annot_key)
         return sentence
 
     def generate_sentences(self, annot_key:str):
-        if annot_key not in self.img_keys:
+        if annot_key not in self.frames:
             raise Warning("Image key not available in provided annotations")
 
-        annotation = self.annotations[annot_key]
-        frames = annotation['frames']
+        self.rng = image_rng(self.seed, annot_key)
+
+        frames = self.frames[annot_key]
         if self.debug:
-            print(frames)
+            print([self.table.decode_frame(f) for f in frames])
         sentences = []
         skipped = 0
         for f in frames:
@@ -459,17 +503,64 @@ class SwigCaptionGenerator:
 
         return sentences, skipped
 
+def build_vocabulary(annotations:dict, stats:CorpusStats = None, table:InternTable = None):
+    """
+    Resolves every distinct role value of the annotations at once. Prepositions
+    are chosen with the whole set as context, i.e. a noun used as an agent or
+    place anywhere in it is not given a generic preposition.
+    """
+    return SwigCaptionGenerator(annotations, stats=stats, table=table).get_vocabulary()
+
+def generate_batch_captions(batch_data:dict, seed:int=1, vocabulary:SwigVocabulary=None, keys:List[str]=None,
+                            table:InternTable=None):
+    hypernym_hits, hypernym_misses = _hypernym_cache.hits, _hypernym_cache.misses
+
+    captionGen = SwigCaptionGenerator(batch_data, seed=seed, vocabulary=vocabulary, keys=keys, table=table)
+    output = {}
+    total_skipped = 0
+    with timed("sentences", items=len(captionGen.img_keys)):
+        for key in captionGen.img_keys:
+            sentences, skipped = captionGen.generate_sentences(key)
+            output[key] = sentences
+            total_skipped += skipped
+
+    count("images", len(output))
+    count("frames_skipped", total_skipped)
+    count("hypernym_cache_hits", _hypernym_cache.hits - hypernym_hits)
+    count("hypernym_cache_misses", _hypernym_cache.misses - hypernym_misses)
+
+    return output, total_skipped
+
 class SwigCaptionV2:
     batch_size:int
     target_file: Path
+    seed: int
+    streaming: bool
+    interned: bool
+    vocabulary: SwigVocabulary
+    table: InternTable
 
     _json:dict
     _item_keys:List
     n_items: int
     total_batch: int
 
-    def __init__(self, targetfile:Path, batch_size:int):
+    def __init__(self, targetfile:Path, batch_size:int, seed:int=1, global_vocabulary:bool=False, streaming:bool=False,
+                 interned:bool=False):
+        """
+        streaming : bool
+            Keep only a byte offset index of the target file in memory and
+            decode the annotations from the file when they are accessed.
+        interned : bool
+            Keep the annotations in memory as EncodedAnnotation of self.table
+            instead of dicts of strings. Ignored when streaming.
+        """
         self.batch_size = batch_size
+        self.seed = seed
+        self.streaming = streaming
+        self.interned = interned and not streaming
+        self.vocabulary = None
+        self.table = InternTable()
 
         self.target_file = targetfile
         self._json = {}
@@ -477,7 +568,12 @@ class SwigCaptionV2:
         self.n_items = 0
         self.total_batch = 0
 
-        self.load_json(targetfile)
+        with timed("json_load"):
+            self.load_json(targetfile)
+        count("annotations", self.n_items)
+
+        if global_vocabulary:
+            self.vocabulary = build_vocabulary(self._json, table=self.table)
 
     def load_json(self, targetfile: Path):
         path = Path(targetfile)
@@ -485,45 +581,100 @@ class SwigCaptionV2:
         if not path.is_file():
             raise ValueError("Target JSON file does not exists")
 
-        with open(targetfile) as f:
-            self._json = json.load(f)
-            self._item_keys = list(self._json.keys())
-            self.n_items = len(self._item_keys)
-            self.total_batch = math.ceil(self.n_items / self.batch_size)
+        if self.streaming:
+            self._json = JsonObjectIndex(targetfile)
+        elif self.interned:
+            self._json = {key: self.table.encode_annotation(annotation)
+                          for key, annotation in iter_json_items(targetfile)}
+        else:
+            with open(targetfile) as f:
+                self._json = json.load(f)
+
+        self._item_keys = list(self._json.keys())
+        self.n_items = len(self._item_keys)
+        self.total_batch = math.ceil(self.n_items / self.batch_size)
 
     def process_batch_data(self, batch_data:dict):
-        captionGen = SwigCaptionGenerator(batch_data)
-        output = {}
-        total_skipped = 0
-        for key in batch_data:
-            sentences, skipped = captionGen.generate_sentences(key)
-            output[key] = sentences
-            total_skipped += skipped
+        return generate_batch_captions(batch_data, seed=self.seed, vocabulary=self.vocabulary, table=self.table)
 
-        return output, total_skipped
+    def batch_range(self, batch_number:int):
+        """
+        Index range [start, end) of the keys of batch batch_number, numbered from 1.
+        """
+        if batch_number < 1 or batch_number > self.total_batch:
+            raise IndexError("Batch number out of range")
 
+        range_start = self.batch_size * (batch_number - 1)
+        range_end = min(range_start + self.batch_size, self.n_items)
 
-    def read_and_generate_batch(self, batch_number):
-        current_batch = batch_number
-        batch_data = {}
+        return range_start, range_end
 
-        range_start = self.batch_size * (current_batch - 1)
-        range_end = range_start + self.batch_size
+    def keys_in_range(self, start:int, end:int):
+        return self._item_keys[start:end]
 
-        if range_end > self.n_items:
-            range_end = self.n_items
+    def batch_keys(self, batch_number:int):
+        return self.keys_in_range(*self.batch_range(batch_number))
 
-        for i in range(range_start, range_end):
-            key = self._item_keys[i-1]
-            batch_data[key] = self._json[key]
+    def iter_batches(self, start_batch:int=1, end_batch:int=None):
+        """
+        Yields (batch_number, keys) for the batches start_batch to end_batch,
+        both included, every key of the file belongs to exactly one batch.
+        """
+        if end_batch is None:
+            end_batch = self.total_batch
 
-        return self.process_batch_data(batch_data)
+        for batch_number in range(start_batch, end_batch + 1):
+            yield batch_number, self.batch_keys(batch_number)
+
+    def get_annotation(self, key:str):
+        annotation = self._json[key]
+        if self.interned:
+            return self.table.decode_annotation(annotation)
+        return annotation
+
+    def iter_annotations(self):
+        if not self.interned:
+            yield from self._json.items()
+            return
+
+        for key, annotation in self._json.items():
+            yield key, self.table.decode_annotation(annotation)
+
+    def resolved_nouns(self, key:str):
+        """
+        Formatted noun, determiner and preposition of every noun of the
+        annotation of key, as resolved by the global vocabulary.
+        """
+        if self.vocabulary is None:
+            raise ValueError("Nouns are only resolved for the whole split with global_vocabulary")
+
+        vocabulary = self.vocabulary
+        nouns = self.table.nouns
+        resolved = {}
+        for frame in self.get_annotation(key)['frames']:
+            for noun in frame.values():
+                if noun == '' or noun in resolved:
+                    continue
+                i = nouns.get(noun)
+                vocab = vocabulary.vocabs[i]
+                resolved[noun] = [vocab, vocabulary.determiners[i], vocabulary.prepositions.get(vocab)]
+        return resolved
+
+    def get_batch_data(self, batch_number):
+        return {key: self._json[key] for key in self.batch_keys(batch_number)}
+
+    def generate_for_keys(self, keys:List[str]):
+        return generate_batch_captions(self._json, seed=self.seed, vocabulary=self.vocabulary, keys=keys,
+                                       table=self.table)
+
+    def read_and_generate_batch(self, batch_number):
+        return self.generate_for_keys(self.batch_keys(batch_number))
 
     def debug_batch_by_role_len(self, role_len:int):
         batch_data = {}
         count = 0
         for key in self._item_keys:
-            annotation = self._json[key]
+            annotation = self.get_annotation(key)
             bboxes = annotation['bb']
 
             if len(bboxes.keys()) == role_len:
@@ -539,7 +690,7 @@ class SwigCaptionV2:
         batch_data = {}
         count = 0
         for key in self._item_keys:
-            annotation = self._json[key]
+            annotation = self.get_annotation(key)
             bboxes = annotation['bb']
 
             if role in bboxes.keys():
@@ -554,14 +705,17 @@ class SwigCaptionV2:
 
     def debug_roles(self):
         roles = {}
+        classes = {}
 
         for key in self._item_keys:
-            annotation = self._json[key]
+            annotation = self.get_annotation(key)
             bboxes = annotation['bb']
 
-            map_keys = list(ROLE_PREPOSITION_MAP.keys())
             for r in bboxes.keys():
-                if r not in map_keys and r not in OBJECT_ROLES:
+                if r not in classes:
+                    classes[r] = RoleClass(r)
+                c = classes[r]
+                if c.preposition is None and c.object_rank != OBJECT_LISTED:
                     if r in roles:
                         roles[r] += 1
                     else:
@@ -575,7 +729,7 @@ class SwigCaptionV2:
         verbs = {}
 
         for key in self._item_keys:
-            annotation = self._json[key]
+            annotation = self.get_annotation(key)
             verb = annotation['verb']
 
             if verb not in verbs:
@@ -0,0 +1,360 @@
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from rolemaps import SUBJECT_ROLES, AGENT_ROLES, OBJECT_ROLES, ROLE_PREPOSITION_MAP, VERB_FORM_MAPS
+
+BENCH_VERSION = 2
+BENCH_DIR = Path("generated/bench")
+
+CASES = ["read_and_generate_batch", "preprocess_frames", "process_frames", "save_captions_to_json", "combine_data"]
+DEFAULT_SIZES = [200, 2000]
+DEFAULT_BATCH_SIZES = [20, 200]
+
+# import time budget of the entry points, in milliseconds
+IMPORT_BUDGETS = {"cli": 300, "main": 300, "combine": 100}
+# only imported on first use, importing an entry point must not load them
+LAZY_MODULES = ["cv2", "nltk", "simplenlg", "numpy"]
+
+# roles weighted towards the common ones, like the SWiG annotations
+_ROLES = AGENT_ROLES * 6 + ['place'] * 6 + SUBJECT_ROLES + OBJECT_ROLES * 2 + list(ROLE_PREPOSITION_MAP.keys())
+
+
+def synthetic_annotations(n_images:int, seed:int=0, n_nouns:int=3000):
+    """
+    SWiG shaped annotations: every image has a verb, one to six roles with a
+    bounding box and three frames giving a noun (a WordNet synset offset
+    taken from the noun table) or '' to every role. Nouns are drawn from
+    n_nouns synsets with a skewed distribution so they repeat like in SWiG.
+    """
+    from wordnettable import load_wordnet_table
+
+    r = random.Random(seed)
+    table = load_wordnet_table()
+    nouns = ["n{:08d}".format(table.offset(r.randrange(len(table)))) for _ in range(min(n_nouns, len(table)))]
+    verbs = sorted(VERB_FORM_MAPS.keys()) + ['glaring', 'racing', 'slouching']
+
+    annotations = {}
+    for i in range(n_images):
+        verb = r.choice(verbs)
+        n_roles = r.randint(1, 6)
+        roles = []
+        while len(roles) < n_roles:
+            role = r.choice(_ROLES)
+            if role not in roles:
+                roles.append(role)
+
+        bb = {}
+        for role in roles:
+            if r.random() < 0.2:
+                bb[role] = [-1, -1, -1, -1]
+            else:
+                x, y = r.randint(0, 400), r.randint(0, 400)
+                bb[role] = [x, y, x + r.randint(10, 112), y + r.randint(10, 112)]
+
+        frames = []
+        for _ in range(3):
+            frames.append({role: '' if r.random() < 0.1 else nouns[int(len(nouns) * r.random() ** 3)]
+                           for role in roles})
+
+        annotations["{}_{}.jpg".format(verb, i)] = {
+            'bb': bb, 'height': 512, 'width': r.randint(300, 512), 'verb': verb, 'frames': frames,
+        }
+    return annotations
+
+
+def write_synthetic_split(root:Path, n_images:int, seed:int=0, target:str="dev.json"):
+    path = Path(root) / "SWiG_jsons" / target
+    os.makedirs(path.parent, exist_ok=True)
+    with open(path, mode='w') as f:
+        json.dump(synthetic_annotations(n_images, seed), f)
+    return path
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    if sys.platform == 'darwin':
+        return peak / (1 << 20)
+    return peak / (1 << 10)
+
+
+def prepare_case(case:str, workdir:Path, n_images:int, batch_size:int, seed:int=0):
+    """
+    Writes the input files of a case to workdir: the synthetic split and,
+    for the cases measuring the output stages, its generated captions.
+    Runs in its own process, so the memory it takes is not counted.
+    """
+    workdir = Path(workdir)
+    split_file = write_synthetic_split(workdir / "SWiG", n_images, seed)
+    if case not in ("save_captions_to_json", "combine_data"):
+        return
+
+    from SwigCaptionsV2 import SwigCaptionV2
+
+    capgen = SwigCaptionV2(split_file, batch_size)
+    batches = [capgen.read_and_generate_batch(i)[0] for i, _ in capgen.iter_batches()]
+    generated = workdir / "generated"
+    os.makedirs(generated, exist_ok=True)
+    if case == "save_captions_to_json":
+        with open(workdir / "batches.json", mode='w') as f:
+            json.dump(batches, f)
+    else:
+        captions = {}
+        for batch in batches:
+            captions.update(batch)
+        with open(generated / "dev.json", mode='w') as f:
+            json.dump(captions, f, indent=2)
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1 << 20)
+    except OSError:
+        # no procfs, e.g. macOS
+        return peak_rss_mb()
+
+
+def run_case(case:str, workdir:Path, n_images:int, batch_size:int):
+    """
+    Runs the measured stage of a case on the files written by prepare_case
+    and returns (seconds, rss_mb) with the resident memory just before the
+    clock starts. Only what the stage itself needs is loaded before.
+    """
+    from corpusstats import load_corpus_stats
+    from wordnettable import load_wordnet_table
+    from SwigCaptionsV2 import SwigCaptionV2, SwigCaptionGenerator, image_rng
+
+    load_corpus_stats()
+    load_wordnet_table()
+
+    workdir = Path(workdir)
+    split_file = workdir / "SWiG" / "SWiG_jsons" / "dev.json"
+
+    if case == "read_and_generate_batch":
+        capgen = SwigCaptionV2(split_file, batch_size)
+        rss = current_rss_mb()
+        start = time.perf_counter()
+        for batch_number, _ in capgen.iter_batches():
+            capgen.read_and_generate_batch(batch_number)
+        return time.perf_counter() - start, rss
+
+    if case in ("preprocess_frames", "process_frames"):
+        capgen = SwigCaptionV2(split_file, batch_size)
+        batches = [capgen.get_batch_data(i) for i, _ in capgen.iter_batches()]
+
+        rss = current_rss_mb()
+        start = time.perf_counter()
+        generators = [SwigCaptionGenerator(batch_data) for batch_data in batches]
+        elapsed = time.perf_counter() - start
+        if case == "preprocess_frames":
+            return elapsed, rss
+
+        rss = current_rss_mb()
+        start = time.perf_counter()
+        for generator in generators:
+            for key in generator.img_keys:
+                generator.rng = image_rng(generator.seed, key)
+                for frame in generator.frames[key]:
+                    generator.process_frames(frame, key)
+        return time.perf_counter() - start, rss
+
+    if case == "save_captions_to_json":
+        from main import save_captions_to_json
+
+        with open(workdir / "batches.json") as f:
+            batches = json.load(f)
+        export_file = workdir / "generated" / "dev.json"
+
+        rss = current_rss_mb()
+        start = time.perf_counter()
+        for captions in batches:
+            save_captions_to_json(captions, export_file)
+        return time.perf_counter() - start, rss
+
+    if case == "combine_data":
+        from combine import combine_data
+
+        rss = current_rss_mb()
+        start = time.perf_counter()
+        combine_data("validation", swigdir=workdir / "SWiG", generateddir=workdir / "generated")
+        return time.perf_counter() - start, rss
+
+    raise ValueError("Unknown benchmark case {}".format(case))
+
+
+def run_in_subprocess(case:str, n_images:int, batch_size:int, seed:int=0):
+    """
+    Prepares a case in one fresh interpreter and runs it in another, so the
+    reported peak RSS only covers the measured stage and what it loads, not
+    the fixtures or the cases run before it.
+    """
+    script = os.path.abspath(__file__)
+    sizes = ["--sizes", str(n_images), "--batch-sizes", str(batch_size), "--seed", str(seed)]
+    with tempfile.TemporaryDirectory() as workdir:
+        result_file = Path(workdir) / "result.json"
+        subprocess.run([sys.executable, script, "--prepare-case", case, "--workdir", workdir] + sizes,
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([sys.executable, script, "--run-case", case, "--workdir", workdir,
+                        "--output", str(result_file)] + sizes, check=True, stdout=subprocess.DEVNULL)
+        with open(result_file) as f:
+            return json.load(f)
+
+
+def git_commit():
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def run_benchmarks(cases:list=CASES, sizes:list=DEFAULT_SIZES, batch_sizes:list=DEFAULT_BATCH_SIZES, seed:int=0):
+    from corpusstats import load_corpus_stats
+    from wordnettable import load_wordnet_table
+
+    # build the statistics files once instead of in every case
+    load_corpus_stats()
+    load_wordnet_table()
+
+    results = []
+    for case in cases:
+        for n_images in sizes:
+            for batch_size in batch_sizes:
+                result = run_in_subprocess(case, n_images, batch_size, seed)
+                results.append(result)
+                print("{case:<24} {n_images:>7} images  batch {batch_size:>5}  "
+                      "{images_per_sec:>10.1f} images/s  {peak_rss_mb:>8.1f} MB  "
+                      "stage {stage_rss_mb:>8.1f} MB".format(**result))
+
+    return {
+        "version": BENCH_VERSION,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def measure_import(module:str, repeat:int=3):
+    """
+    Returns the fastest cumulative import time of module in milliseconds,
+    as reported by python -X importtime in fresh interpreters, and the
+    LAZY_MODULES it loaded.
+    """
+    code = "import {}, sys; print(' '.join(m for m in {!r} if m in sys.modules))".format(module, LAZY_MODULES)
+    best = None
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        loaded = output.stdout.split()
+        for line in output.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].rstrip() == " " + module:
+                milliseconds = int(fields[1]) / 1000
+                best = milliseconds if best is None else min(best, milliseconds)
+    return best, loaded
+
+
+def check_imports(budgets:dict=IMPORT_BUDGETS):
+    """Prints the import time of every entry point and returns False when one is over budget or loads a lazy module."""
+    ok = True
+    for module, budget in budgets.items():
+        milliseconds, loaded = measure_import(module)
+        failed = milliseconds > budget or len(loaded) > 0
+        ok = ok and not failed
+        print("{:<24} {:>8.1f} ms  budget {:>5} ms  {}{}".format(
+            module, milliseconds, budget, "FAIL" if failed else "ok",
+            "  loads " + ", ".join(loaded) if loaded else ""))
+    return ok
+
+
+def compare_results(baseline:dict, current:dict):
+    """Prints the images/sec and stage memory ratio of current over baseline for every common case."""
+    def by_case(report):
+        return {(r["case"], r["n_images"], r["batch_size"]): r for r in report["results"]}
+
+    old = by_case(baseline)
+    for key, result in by_case(current).items():
+        if key not in old:
+            continue
+        speed = result["images_per_sec"] / old[key]["images_per_sec"]
+        # reports before version 2 only have the peak of the whole process
+        field = "stage_rss_mb" if "stage_rss_mb" in old[key] else "peak_rss_mb"
+        memory = result[field] / old[key][field] if old[key][field] > 0 else 1.0
+        print("{:<24} {:>7} images  batch {:>5}  speed x{:.2f}  memory x{:.2f}".format(*key, speed, memory))
+
+
+def add_arguments(parser:argparse.ArgumentParser):
+    parser.add_argument("--cases", nargs="+", default=CASES, choices=CASES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="number of images")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file, generated/bench/<commit>.json by default")
+    parser.add_argument("--compare", help="results file of a previous run to compare against")
+    parser.add_argument("--check-imports", action="store_true",
+                        help="only check the import time budget of the entry points, exits with 1 when exceeded")
+
+
+def run_from_args(args:argparse.Namespace):
+    if args.check_imports:
+        sys.exit(0 if check_imports() else 1)
+
+    report = run_benchmarks(args.cases, args.sizes, args.batch_sizes, args.seed)
+
+    output = Path(args.output) if args.output else BENCH_DIR / "{}.json".format(report["commit"] or "results")
+    os.makedirs(output.parent, exist_ok=True)
+    with open(output, mode='w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results saved to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results(json.load(f), report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the caption pipeline on synthetic SWiG data")
+    add_arguments(parser)
+    parser.add_argument("--prepare-case", help=argparse.SUPPRESS)
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare_case:
+        prepare_case(args.prepare_case, Path(args.workdir), args.sizes[0], args.batch_sizes[0], args.seed)
+        sys.exit(0)
+
+    if args.run_case:
+        n_images, batch_size = args.sizes[0], args.batch_sizes[0]
+        seconds, rss = run_case(args.run_case, Path(args.workdir), n_images, batch_size)
+        peak = peak_rss_mb()
+        result = {
+            "case": args.run_case,
+            "n_images": n_images,
+            "batch_size": batch_size,
+            "seconds": seconds,
+            "images_per_sec": n_images / seconds if seconds > 0 else 0.0,
+            "peak_rss_mb": peak,
+            # growth of the peak over the memory held when the stage started
+            "stage_rss_mb": max(0.0, peak - rss),
+        }
+        with open(args.output, mode='w') as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    run_from_args(args)
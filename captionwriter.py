@@ -0,0 +1,185 @@
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+
+
+def write_atomic(path:Path, text:str):
+    """
+    Replaces path with text through a synced temporary file, so a crash
+    leaves either the old or the new content behind.
+    """
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, mode='w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class JsonlCaptionWriter:
+    """
+    Append only caption writer, every image is written as a single
+    {"<image key>": [captions]} line so the cost of a batch does not depend
+    on how much was already generated. The file is flushed after every batch
+    and fsynced every fsync_every batches.
+
+    offset : int
+        When given the file is truncated to offset bytes before appending,
+        which drops anything written after the last checkpoint. A file
+        shorter than offset can not be resumed and raises.
+    """
+    path: Path
+    fsync_every: int
+
+    def __init__(self, path:Path, fsync_every:int=10, offset:int=None):
+        self.path = Path(path)
+        self.fsync_every = fsync_every
+        self._pending = 0
+
+        if not os.path.exists(self.path.parent):
+            os.makedirs(self.path.parent)
+
+        if offset is not None:
+            # truncate would pad a shorter file with null bytes
+            size = os.path.getsize(self.path) if os.path.isfile(self.path) else 0
+            if size < offset:
+                raise ValueError(f'{self.path} holds {size} bytes but the checkpoint expects {offset}, '
+                                 f'it was removed or truncated. Run without resume to start over.')
+
+        self._file = open(self.path, mode='a')
+        if offset is not None:
+            self._file.truncate(offset)
+
+    def write(self, captions:dict):
+        lines = [json.dumps({k: captions[k]}) + "\n" for k in captions]
+        self._file.write("".join(lines))
+        self._file.flush()
+
+        self._pending += 1
+        if self.fsync_every > 0 and self._pending >= self.fsync_every:
+            self.sync()
+
+    def tell(self):
+        """Size of the file once everything written so far is flushed."""
+        self._file.flush()
+        return os.fstat(self._file.fileno()).st_size
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.sync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class BackgroundWriter:
+    """
+    Runs the writes of finished batches on a thread, in submission order,
+    so generation goes on while they reach the disk. At most max_pending
+    writes are queued and submit blocks beyond that, a max_pending of 0 or
+    less runs every write directly in submit instead.
+
+    A failed write is raised by the next submit or by close, and the writes
+    queued after it are dropped so no checkpoint gets ahead of the data.
+    close runs everything still queued, also when generation failed.
+    """
+    max_pending: int
+
+    def __init__(self, max_pending:int=4):
+        self.max_pending = max_pending
+        self._error = None
+        self._failed = False
+        self._closed = False
+        self._thread = None
+        if max_pending > 0:
+            self._queue = queue.Queue(maxsize=max_pending)
+            self._thread = threading.Thread(target=self._run, name="caption-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            if self._failed:
+                continue
+            function, args = task
+            try:
+                function(*args)
+            except BaseException as e:
+                self._error = e
+                self._failed = True
+
+    def _raise_error(self):
+        # raised only once, the writer stays failed
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, function, *args):
+        if self._closed:
+            raise ValueError("Writer is closed")
+        self._raise_error()
+        if self._failed:
+            raise ValueError("An earlier write failed")
+
+        if self._thread is None:
+            function(*args)
+        else:
+            self._queue.put((function, args))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_jsonl_captions(jsonl_file:Path):
+    captions = {}
+    with open(jsonl_file) as f:
+        for line in f:
+            # a line without newline is a write interrupted by a crash
+            if not line.endswith("\n"):
+                break
+            captions.update(json.loads(line))
+    return captions
+
+
+def finalize_jsonl(jsonl_file:Path, export_file:Path):
+    """
+    Merges the streamed captions into the dict shaped export JSON, keeping the
+    keys already present in export_file like save_captions_to_json does.
+    """
+    feeds = {}
+    if os.path.isfile(export_file):
+        with open(export_file) as f:
+            feeds = json.load(f)
+
+    feeds.update(read_jsonl_captions(jsonl_file))
+
+    write_atomic(export_file, json.dumps(feeds, indent=2))
+
+    return len(feeds)
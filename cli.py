@@ -0,0 +1,32 @@
+import argparse
+
+import bench
+import combine
+import corpusstats
+import main
+
+# subcommand -> (module with add_arguments and run_from_args, help)
+COMMANDS = {
+    "generate": (main, "generate the captions of a SWiG split"),
+    "combine": (combine, "add the generated captions to the SWiG annotations"),
+    "stats": (corpusstats, "count the determiner and preposition statistics of a tagged corpus"),
+    "bench": (bench, "benchmark the pipeline on synthetic SWiG data"),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="swig-captions", description="Generate and store captions for SWiG")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (module, description) in COMMANDS.items():
+        module.add_arguments(subparsers.add_parser(name, help=description, description=description))
+    return parser
+
+
+def run(argv=None):
+    args = build_parser().parse_args(argv)
+    module, _ = COMMANDS[args.command]
+    module.run_from_args(args)
+
+
+if __name__ == '__main__':
+    run()
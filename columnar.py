@@ -0,0 +1,200 @@
+import json
+import os
+import shutil
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from interning import InternTable
+
+COLUMNAR_VERSION = 1
+
+# int64 offsets into the flattened columns, image i owns [offsets[i], offsets[i+1])
+_OFFSET_COLUMNS = ["key_offsets", "role_offsets", "frame_offsets", "entry_offsets", "caption_offsets", "text_offsets"]
+
+
+class ColumnarWriter:
+    """
+    Writes combined SWiG records into a directory of flat numpy columns that
+    a reader can memory map and access by image index without parsing:
+
+        meta.json        version, number of images, verb, role and noun tables
+        key_bytes        uint8 utf-8 image keys, split by key_offsets
+        verb_ids         int32 per image
+        height, width    int32 per image, -1 when missing
+        role_ids, bb     int32 role and int16 [x1, y1, x2, y2] box per bb entry,
+                         split by role_offsets
+        entry_roles,     int32 role and noun of every frame entry, noun -1 for
+        entry_nouns      an empty value; split into frames by entry_offsets and
+                         frames into images by frame_offsets
+        text_bytes       uint8 utf-8 captions, split by text_offsets; captions
+                         are split into images by caption_offsets
+        caption_ids      int64 index of the 'caption' of every image, -1 if none
+
+    The directory is written next to path and only moved into place by close().
+    """
+    path: Path
+
+    def __init__(self, path:Path):
+        self.path = Path(path)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        if os.path.exists(self._tmp):
+            shutil.rmtree(self._tmp)
+        os.makedirs(self._tmp)
+
+        self.table = InternTable()
+
+        self._key_bytes = bytearray()
+        self._text_bytes = bytearray()
+        self._columns = {
+            "verb_ids": array('i'),
+            "height": array('i'),
+            "width": array('i'),
+            "role_ids": array('i'),
+            "bb": array('h'),
+            "entry_roles": array('i'),
+            "entry_nouns": array('i'),
+            "caption_ids": array('q'),
+        }
+        for name in _OFFSET_COLUMNS:
+            self._columns[name] = array('q', [0])
+        self.n_images = 0
+
+    def add(self, key:str, record:dict):
+        c = self._columns
+
+        self._key_bytes += key.encode('utf-8')
+        c["key_offsets"].append(len(self._key_bytes))
+
+        encoded = self.table.encode_annotation(record)
+        c["verb_ids"].append(encoded.verb)
+        c["height"].append(encoded.height)
+        c["width"].append(encoded.width)
+
+        c["role_ids"].extend(encoded.bb_roles)
+        c["bb"].extend(encoded.bb)
+        c["role_offsets"].append(len(c["role_ids"]))
+
+        for frame in encoded.frames:
+            c["entry_roles"].extend(frame[0::2])
+            c["entry_nouns"].extend(frame[1::2])
+            c["entry_offsets"].append(len(c["entry_roles"]))
+        c["frame_offsets"].append(len(c["entry_offsets"]) - 1)
+
+        captions = record.get('captions', [])
+        first = len(c["text_offsets"]) - 1
+        for text in captions:
+            self._text_bytes += text.encode('utf-8')
+            c["text_offsets"].append(len(self._text_bytes))
+        c["caption_offsets"].append(len(c["text_offsets"]) - 1)
+
+        caption = record.get('caption', '')
+        c["caption_ids"].append(first + captions.index(caption) if caption in captions else -1)
+
+        self.n_images += 1
+
+    def close(self):
+        np.save(self._tmp / "key_bytes.npy", np.frombuffer(bytes(self._key_bytes), dtype=np.uint8))
+        np.save(self._tmp / "text_bytes.npy", np.frombuffer(bytes(self._text_bytes), dtype=np.uint8))
+        for name, values in self._columns.items():
+            column = np.frombuffer(values, dtype=np.dtype(values.typecode)) if len(values) > 0 \
+                else np.zeros(0, dtype=np.dtype(values.typecode))
+            if name == "bb":
+                column = column.reshape(-1, 4)
+            np.save(self._tmp / (name + ".npy"), column)
+
+        meta = {
+            "version": COLUMNAR_VERSION,
+            "n_images": self.n_images,
+            "verbs": self.table.verbs.strings,
+            "roles": self.table.roles.strings,
+            "nouns": self.table.nouns.strings,
+        }
+        with open(self._tmp / "meta.json", mode='w') as f:
+            f.write(json.dumps(meta))
+
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        shutil.rmtree(self._tmp)
+
+
+class ColumnarDataset:
+    """
+    Random access to a directory written by ColumnarWriter. Every column is
+    memory mapped, so opening is cheap and image i is read in O(1).
+    """
+    path: Path
+    verbs: list
+    roles: list
+    nouns: list
+
+    def __init__(self, path:Path):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as f:
+            meta = json.load(f)
+
+        if meta.get("version") != COLUMNAR_VERSION:
+            raise ValueError("Columnar dataset has an incompatible version")
+
+        self.n_images = meta["n_images"]
+        self.verbs = meta["verbs"]
+        self.roles = meta["roles"]
+        self.nouns = meta["nouns"]
+        self._key_index = None
+
+        for name in ["key_bytes", "text_bytes", "verb_ids", "height", "width", "role_ids", "bb",
+                     "entry_roles", "entry_nouns", "caption_ids"] + _OFFSET_COLUMNS:
+            setattr(self, name, np.load(self.path / (name + ".npy"), mmap_mode='r'))
+
+    def __len__(self):
+        return self.n_images
+
+    def key(self, i:int):
+        return bytes(self.key_bytes[self.key_offsets[i]:self.key_offsets[i + 1]]).decode('utf-8')
+
+    def index(self, key:str):
+        if self._key_index is None:
+            self._key_index = {self.key(i): i for i in range(self.n_images)}
+        return self._key_index[key]
+
+    def caption_text(self, caption_id:int):
+        start, end = self.text_offsets[caption_id], self.text_offsets[caption_id + 1]
+        return bytes(self.text_bytes[start:end]).decode('utf-8')
+
+    def captions(self, i:int):
+        return [self.caption_text(c) for c in range(self.caption_offsets[i], self.caption_offsets[i + 1])]
+
+    def __getitem__(self, i:int):
+        """
+        Returns image i as a combined record: bb, height, width, verb, frames,
+        captions and caption.
+        """
+        role_start, role_end = self.role_offsets[i], self.role_offsets[i + 1]
+        bb = {}
+        for r in range(role_start, role_end):
+            bb[self.roles[self.role_ids[r]]] = [int(v) for v in self.bb[r]]
+
+        frames = []
+        for f in range(self.frame_offsets[i], self.frame_offsets[i + 1]):
+            frame = {}
+            for e in range(self.entry_offsets[f], self.entry_offsets[f + 1]):
+                noun = self.entry_nouns[e]
+                frame[self.roles[self.entry_roles[e]]] = self.nouns[noun] if noun >= 0 else ''
+            frames.append(frame)
+
+        caption_id = self.caption_ids[i]
+
+        record = {'bb': bb}
+        if self.height[i] >= 0:
+            record['height'] = int(self.height[i])
+        if self.width[i] >= 0:
+            record['width'] = int(self.width[i])
+        record['verb'] = self.verbs[self.verb_ids[i]]
+        record['frames'] = frames
+        record['captions'] = self.captions(i)
+        record['caption'] = self.caption_text(caption_id) if caption_id >= 0 else ''
+        return record
@@ -1,9 +1,11 @@
 from pathlib import Path
+import argparse
 import json
 import os
 from typing import List
 
-from SwigCaptionsV2 import show_img
+from visualize import show_img
+from jsonstream import JsonObjectIndex, JsonObjectWriter, iter_json_items
 
 def get_max_len_caption(captions:List[str], fallback=''):
     if not captions:
@@ -14,7 +16,13 @@ def get_max_len_caption(captions:List[str], fallback=''):
             max_str = x
     return max_str
 
-def combine_data(dataset, swigdir="SWiG", generateddir="generated/v2"):
+def combine_data(dataset, swigdir="SWiG", generateddir="generated/v2", export_format="json"):
+    """
+    export_format : str
+        'json' writes SWiG/combined_jsons/<split>.json, 'columnar' writes the
+        memory mappable columns of columnar.ColumnarWriter to
+        SWiG/combined_columnar/<split>/
+    """
     dataset_to_file = {
         "validation": "dev.json",
         "test": "test.json",
@@ -28,8 +36,15 @@ def combine_data(dataset, swigdir="SWiG", generateddir="generated/v2"):
 
     swig_target = swig / "SWiG_jsons" / target
     generated_target = generated / target
-    export_path = swig / "combined_jsons"
-    export_target = swig / "combined_jsons" / target
+
+    if export_format == "json":
+        export_path = swig / "combined_jsons"
+        export_target = swig / "combined_jsons" / target
+    elif export_format == "columnar":
+        export_path = swig / "combined_columnar"
+        export_target = swig / "combined_columnar" / Path(target).stem
+    else:
+        raise ValueError("Export format must be either json or columnar")
 
     if not os.path.exists(swig_target):
         raise ValueError("SWiG target file does not exists")
@@ -41,39 +56,37 @@ def combine_data(dataset, swigdir="SWiG", generateddir="generated/v2"):
     if not os.path.exists(export_path):
         os.makedirs(export_path)
 
-    # Opening JSON file
-    swig_file = open(swig_target)
-    generated_file = open(generated_target)
-
-    swig_json = json.load(swig_file)
-    generated_json = json.load(generated_file)
-
-    combined = {}
-
     total = 0
     updated = 0
-    for key in swig_json.keys():
-        temp = swig_json[key]
-        try:
-            captions = generated_json[key]
-        except KeyError:
-            total += 1
-            continue
-
-        temp['captions'] = captions
-        temp['caption'] = get_max_len_caption(captions)
-        combined[key] = temp
-        updated += 1
-        total += 1
-
-    swig_file.close()
-    generated_file.close()
 
-    print(f'Total {updated} items updated out of {total}')
-
-    with open(export_target, mode='w') as f:
-        f.write(json.dumps(combined))
+    # records are written one by one, so only a single annotation is held
+    # in memory at any time
+    if export_format == "json":
+        writer = JsonObjectWriter(export_target)
+    else:
+        # numpy is only loaded for the columnar export
+        from columnar import ColumnarWriter
+        writer = ColumnarWriter(export_target)
+
+    try:
+        with JsonObjectIndex(generated_target) as generated_json:
+            for key, temp in iter_json_items(swig_target):
+                total += 1
+                if key not in generated_json:
+                    continue
+
+                captions = generated_json[key]
+                temp['captions'] = captions
+                temp['caption'] = get_max_len_caption(captions)
+
+                writer.add(key, temp)
+                updated += 1
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
 
+    print(f'Total {updated} items updated out of {total}')
     print(f'Combined dataset saved to file {str(export_target)}')
 
 def check_max_len(dataset, generateddir="generated/v2"):
@@ -119,12 +132,8 @@ def debug_dataset(dataset, generateddir="SWiG/combined_jsons", img_dir="SWiG/ima
     imgpath = Path(img_dir)
     targetfile = generated / target
 
-    generated_file = open(targetfile)
-    alljson = json.load(generated_file)
-
     count = 0
-    for key in alljson.keys():
-        annotation = alljson[key]
+    for key, annotation in iter_json_items(targetfile):
         targetimg = imgpath / key
 
         bboxes = annotation['bb']
@@ -138,7 +147,29 @@ def debug_dataset(dataset, generateddir="SWiG/combined_jsons", img_dir="SWiG/ima
                 break
 
 
+def add_arguments(parser:argparse.ArgumentParser):
+    parser.add_argument("--split", default="validation", choices=["validation", "test", "train"])
+    parser.add_argument("--swig-dir", default="SWiG", help="directory holding SWiG_jsons and images_512")
+    parser.add_argument("--generated-dir", default="generated/v2", help="directory of the generated captions")
+    parser.add_argument("--output-format", default="json", choices=["json", "columnar"])
+    parser.add_argument("--check-max-len", action="store_true",
+                        help="only print the word count of the longest generated caption")
+    parser.add_argument("--debug", action="store_true",
+                        help="only show the boxes of a few combined images, needs cv2")
+
+
+def run_from_args(args:argparse.Namespace):
+    if args.check_max_len:
+        check_max_len(args.split, generateddir=args.generated_dir)
+    elif args.debug:
+        swig = Path(args.swig_dir)
+        debug_dataset(args.split, generateddir=swig / "combined_jsons", img_dir=swig / "images_512")
+    else:
+        combine_data(args.split, swigdir=args.swig_dir, generateddir=args.generated_dir,
+                     export_format=args.output_format)
+
+
 if __name__ == '__main__':
-    # combine_data("validation")
-    # check_max_len("train")
-    debug_dataset('validation')
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Add the generated captions to the SWiG annotations")
+    add_arguments(parser)
+    run_from_args(parser.parse_args())
@@ -0,0 +1,212 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List
+import os
+
+from corpusstats import CorpusStats, NLGCorpusStats, BROWN_CORPUS, DEFAULT_STATS_FILE, DEFAULT_NLG_STATS_FILE
+from encodedcorpus import EncodedCorpus
+
+DEFAULT_CHUNK_SIZE = 1000000
+# parts queued per worker, bounds the results held in memory
+PENDING_PER_WORKER = 2
+# the longest n-gram counted is a trigram, so every part is counted after
+# the last two tokens of the text before it
+CONTEXT_SIZE = 2
+
+
+class TaggedCorpus:
+    """
+    Source of (word, tag) pairs the determiner and preposition statistics
+    are counted from. Tags are the universal tagset ('DET', 'ADP', 'NOUN', ...).
+
+    The corpus is counted in parts: iter_parts yields small picklable
+    descriptions of consecutive parts of the corpus, and read_part turns one
+    into (context, tokens) in the counting process, context being the last
+    tokens before the part. By default the parts are the tokens themselves.
+    """
+    name: str
+
+    def iter_tagged_words(self) -> Iterable[tuple]:
+        raise NotImplementedError
+
+    def iter_parts(self, chunk_size:int=DEFAULT_CHUNK_SIZE):
+        return iter_chunks(self.iter_tagged_words(), chunk_size)
+
+    def read_part(self, part):
+        return part
+
+
+class BrownCorpus(TaggedCorpus):
+    name = BROWN_CORPUS
+
+    def iter_tagged_words(self):
+        from nltk.corpus import brown
+        return iter(brown.tagged_words(tagset="universal"))
+
+
+class TaggedTextCorpus(TaggedCorpus):
+    """
+    Local plain text corpus of whitespace separated word/TAG tokens.
+
+    Parts are line aligned byte ranges of the files, with the tokens just
+    before them, so the counting processes read and parse the text
+    themselves and only the file offsets are sent to them.
+
+    paths : list
+        files, or directories whose files are read in name order
+    separator : str
+        between the word and its tag, split at its last occurrence
+    """
+    paths: List[Path]
+    separator: str
+
+    # average size of a token, e.g. 'the/DET ', to turn a chunk size into bytes
+    BYTES_PER_TOKEN = 8
+
+    def __init__(self, paths:List[Path], separator:str="/"):
+        self.paths = [Path(p) for p in paths]
+        self.separator = separator
+        self.name = ",".join(str(p) for p in self.paths)
+
+    def files(self):
+        for path in self.paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    if os.path.isfile(path / name):
+                        yield path / name
+            else:
+                yield path
+
+    def parse(self, text:str):
+        for token in text.split():
+            word, separator, tag = token.rpartition(self.separator)
+            if separator and word:
+                yield word, tag
+
+    def iter_tagged_words(self):
+        for path in self.files():
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    yield from self.parse(line)
+
+    def _tokens_before(self, files:List[Path], file_index:int, offset:int):
+        """The last CONTEXT_SIZE tokens before offset of files[file_index], going back into the previous files."""
+        tokens = []
+        while True:
+            needed = CONTEXT_SIZE - len(tokens)
+            window = 256
+            with open(files[file_index], 'rb') as f:
+                while True:
+                    start = max(0, offset - window)
+                    f.seek(start)
+                    pieces = f.read(offset - start).decode('utf-8', errors='replace').split()
+                    if start > 0 and pieces:
+                        # the first piece may be cut by the window
+                        pieces = pieces[1:]
+                    found = list(self.parse(" ".join(pieces)))
+                    if len(found) >= needed or start == 0:
+                        break
+                    window *= 4
+
+            tokens = found[-needed:] + tokens if found else tokens
+            if len(tokens) >= CONTEXT_SIZE or file_index == 0:
+                return tokens
+            file_index -= 1
+            offset = os.path.getsize(files[file_index])
+
+    def iter_parts(self, chunk_size:int=DEFAULT_CHUNK_SIZE):
+        """Yields (path, start, end, context) for consecutive byte ranges of about chunk_size tokens."""
+        files = list(self.files())
+        chunk_bytes = max(1, chunk_size * self.BYTES_PER_TOKEN)
+        for file_index, path in enumerate(files):
+            size = os.path.getsize(path)
+            start = 0
+            with open(path, 'rb') as f:
+                while start < size:
+                    end = start + chunk_bytes
+                    if end < size:
+                        # tokens never span lines
+                        f.seek(end)
+                        f.readline()
+                        end = f.tell()
+                    else:
+                        end = size
+                    yield str(path), start, end, self._tokens_before(files, file_index, start)
+                    start = end
+
+    def read_part(self, part):
+        path, start, end, context = part
+        with open(path, 'rb') as f:
+            f.seek(start)
+            text = f.read(end - start).decode('utf-8')
+        return context, list(self.parse(text))
+
+
+def iter_chunks(tagged_words:Iterable[tuple], chunk_size:int=DEFAULT_CHUNK_SIZE):
+    """Yields (context, chunk), context being the last tokens of the previous chunks."""
+    context = []
+    chunk = []
+    for pair in tagged_words:
+        chunk.append(pair)
+        if len(chunk) >= chunk_size:
+            yield context, chunk
+            context = (context + chunk)[-CONTEXT_SIZE:]
+            chunk = []
+    if chunk:
+        yield context, chunk
+
+
+def _count_part(corpus:TaggedCorpus, part):
+    context, tokens = corpus.read_part(part)
+    encoded = EncodedCorpus.from_tagged_words(context + tokens)
+    return (CorpusStats.from_encoded(encoded, context=len(context)),
+            NLGCorpusStats.from_encoded(encoded, context=len(context)))
+
+
+def count_corpus_stats(corpus:TaggedCorpus, workers:int=1, chunk_size:int=DEFAULT_CHUNK_SIZE):
+    """
+    Counts the statistics of CorpusStats and NLGCorpusStats over corpus in
+    parts of about chunk_size tokens, by a process pool when workers is
+    more than one. Every n-gram is counted in exactly one part and the
+    partial counts are merged in corpus order, so the result is the same as
+    a single scan of the corpus, ties included.
+    """
+    stats, nlg_stats = CorpusStats(), NLGCorpusStats()
+    parts = corpus.iter_parts(chunk_size)
+
+    if workers <= 1:
+        for part in parts:
+            part_stats, part_nlg_stats = _count_part(corpus, part)
+            stats.merge(part_stats)
+            nlg_stats.merge(part_nlg_stats)
+        return stats, nlg_stats
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for part in parts:
+            pending.append(pool.submit(_count_part, corpus, part))
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                part_stats, part_nlg_stats = pending.popleft().result()
+                stats.merge(part_stats)
+                nlg_stats.merge(part_nlg_stats)
+
+        while pending:
+            part_stats, part_nlg_stats = pending.popleft().result()
+            stats.merge(part_stats)
+            nlg_stats.merge(part_nlg_stats)
+
+    return stats, nlg_stats
+
+
+def build_corpus_stats(corpus:TaggedCorpus, workers:int=1, chunk_size:int=DEFAULT_CHUNK_SIZE,
+                       stats_file:Path=DEFAULT_STATS_FILE, nlg_stats_file:Path=DEFAULT_NLG_STATS_FILE):
+    """
+    Counts the statistics of corpus and saves them where the caption
+    generators load them from, replacing the Brown statistics. Only the
+    choices a lookup can return are saved, see CorpusStats.pruned.
+    """
+    stats, nlg_stats = count_corpus_stats(corpus, workers, chunk_size)
+    stats.save(stats_file, corpus=corpus.name)
+    nlg_stats.save(nlg_stats_file, corpus=corpus.name)
+    return stats, nlg_stats
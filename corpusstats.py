@@ -0,0 +1,399 @@
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import List, TYPE_CHECKING
+
+from rolemaps import DETERMINERS_LIST
+
+if TYPE_CHECKING:
+    from encodedcorpus import EncodedCorpus
+
+STATS_VERSION = 1
+DEFAULT_STATS_FILE = Path("generated/cache/brown_stats.json")
+DEFAULT_NLG_STATS_FILE = Path("generated/cache/brown_nlg_stats.json")
+# corpus of the statistics built when no file is found
+BROWN_CORPUS = "brown"
+# the prepositions place phrases are restricted to
+PLACE_PREPOSITIONS = ['at', 'in', 'on']
+
+
+def _count(table:dict, noun:str, choice:str):
+    counts = table.get(noun)
+    if counts is None:
+        counts = table[noun] = {}
+    counts[choice] = counts.get(choice, 0) + 1
+
+
+def _merge(table:dict, other:dict):
+    # other counts later corpus positions, so its new entries go last
+    for noun, choices in other.items():
+        counts = table.get(noun)
+        if counts is None:
+            counts = table[noun] = {}
+        for choice, count in choices.items():
+            counts[choice] = counts.get(choice, 0) + count
+
+
+def _most_used(table:dict, targetset:set, allowed:List=None):
+    most_used_dict = dict()
+    for target in targetset:
+        counts = table.get(target)
+        if not counts:
+            continue
+        best, best_count = None, 0
+        for choice, count in counts.items():
+            if allowed and choice not in allowed:
+                continue
+            # strict comparison keeps the first seen choice on ties
+            if count > best_count:
+                best, best_count = choice, count
+        if best is not None:
+            most_used_dict[target] = best.replace("_", " ")
+    return most_used_dict
+
+
+def _prune(table:dict, allowed_lists:List[List]=()):
+    """
+    Keeps only the choices a lookup can return, in their order: the first
+    and the last of the most used choices of every noun, and the first most
+    used among each list of allowed_lists. Lookups restricted to other lists
+    need the full table.
+    """
+    pruned = {}
+    for noun, counts in table.items():
+        keep = set()
+        for allowed in [None] + list(allowed_lists):
+            first, last, best_count = None, None, 0
+            for choice, count in counts.items():
+                if allowed and choice not in allowed:
+                    continue
+                if count > best_count:
+                    first, last, best_count = choice, choice, count
+                elif count == best_count:
+                    last = choice
+            keep.update(c for c in (first, last) if c is not None)
+        pruned[noun] = {choice: count for choice, count in counts.items() if choice in keep}
+    return pruned
+
+
+def _save_tables(path:Path, version:int, corpus:str, tables:dict):
+    path = Path(path)
+    if not os.path.exists(path.parent):
+        os.makedirs(path.parent)
+
+    data = {"version": version, "corpus": corpus}
+    data.update(tables)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, mode='w') as f:
+        f.write(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def _load_tables(path:Path, version:int):
+    with open(path) as f:
+        data = json.load(f)
+
+    if data.get("version") != version:
+        raise ValueError("Corpus statistics file has an incompatible version")
+
+    return data
+
+
+class CorpusStats:
+    """
+    Noun level determiner and preposition counts collected from a tagged corpus.
+
+    determiners : dict
+        noun -> {determiner: count}, for every determiner in DETERMINERS_LIST
+        directly preceding the (lowercased) noun
+    prepositions : dict
+        noun -> {preposition: count}, for every ADP DET noun trigram
+
+    The inner dicts keep the order in which each choice was first seen in the
+    corpus, so ties are resolved the same way as a sequential corpus scan.
+    """
+    determiners: dict
+    prepositions: dict
+
+    def __init__(self, determiners:dict=None, prepositions:dict=None):
+        self.determiners = determiners if determiners is not None else {}
+        self.prepositions = prepositions if prepositions is not None else {}
+
+    @classmethod
+    def from_tagged_words(cls, tagged_words):
+        stats = cls()
+        p, d = None, None
+        for n in tagged_words:
+            if d is not None:
+                noun = n[0].lower()
+                det = d[0].lower()
+                if det in DETERMINERS_LIST:
+                    _count(stats.determiners, noun, det)
+                if p is not None and d[1] == "DET" and p[1] == "ADP":
+                    _count(stats.prepositions, noun, p[0].lower())
+            p, d = d, n
+        return stats
+
+    @classmethod
+    def from_encoded(cls, corpus:'EncodedCorpus', targets:set=None, context:int=0):
+        """
+        Same counts as from_tagged_words, computed with array masks over an
+        encoded corpus. targets restricts the (lowercase) nouns counted, and
+        the first context words only serve as the left context of the rest.
+        """
+        lower = corpus.lower_ids
+
+        (d, n), _ = corpus.ngrams(2, context)
+        mask = corpus.word_set_mask(lower[d], DETERMINERS_LIST)
+        determiners = corpus.count_pairs(lower[n[mask]], lower[d[mask]], targets=targets)
+
+        (p, d, n), (pt, dt, _) = corpus.ngrams(3, context)
+        mask = (dt == corpus.tag_id("DET")) & (pt == corpus.tag_id("ADP"))
+        prepositions = corpus.count_pairs(lower[n[mask]], lower[p[mask]], targets=targets)
+
+        return cls(determiners, prepositions)
+
+    def merge(self, other:'CorpusStats'):
+        """Adds the counts of other, collected from the corpus text following this one."""
+        _merge(self.determiners, other.determiners)
+        _merge(self.prepositions, other.prepositions)
+
+    def most_used_determiners(self, targetset:set):
+        return _most_used(self.determiners, targetset)
+
+    def most_used_prepositions(self, targetset:set, preplist:List=None):
+        return _most_used(self.prepositions, targetset, allowed=preplist)
+
+    def pruned(self):
+        """Statistics with the same lookup results, with only the choices they can return."""
+        return CorpusStats(_prune(self.determiners), _prune(self.prepositions, [PLACE_PREPOSITIONS]))
+
+    def save(self, path:Path, prune:bool=True, corpus:str=BROWN_CORPUS):
+        """Saves the statistics, counted from the corpus named corpus, to path."""
+        stats = self.pruned() if prune else self
+        _save_tables(path, STATS_VERSION, corpus, {
+            "determiners_list": DETERMINERS_LIST,
+            "place_prepositions": PLACE_PREPOSITIONS,
+            "determiners": stats.determiners,
+            "prepositions": stats.prepositions,
+        })
+
+    @classmethod
+    def load(cls, path:Path):
+        data = _load_tables(path, STATS_VERSION)
+        if data.get("determiners_list") != DETERMINERS_LIST:
+            raise ValueError("Corpus statistics were counted for other determiners")
+        # the saved prepositions are pruned to the most used place preposition
+        if data.get("place_prepositions") != PLACE_PREPOSITIONS:
+            raise ValueError("Corpus statistics were saved for other place prepositions")
+        return cls(data["determiners"], data["prepositions"])
+
+
+class NLGCorpusStats:
+    """
+    Case sensitive counts matching the corpus scans of NLGSentenceGenerator.
+
+    determiners : dict
+        word -> {determiner: count}, for every DET directly preceding the word
+    trigram_prepositions : dict
+        noun -> {"<preposition>_<determiner>": count}, for every ADP DET NOUN trigram
+    bigram_prepositions : dict
+        noun -> {preposition: count}, for every ADP NOUN bigram
+
+    Choices are kept in first seen order like CorpusStats. The single word
+    lookups return the last of the tied most used choices, as a scan sorted by
+    count did, and the set lookups the first one.
+    """
+    determiners: dict
+    trigram_prepositions: dict
+    bigram_prepositions: dict
+
+    def __init__(self, determiners:dict=None, trigram_prepositions:dict=None, bigram_prepositions:dict=None):
+        self.determiners = determiners if determiners is not None else {}
+        self.trigram_prepositions = trigram_prepositions if trigram_prepositions is not None else {}
+        self.bigram_prepositions = bigram_prepositions if bigram_prepositions is not None else {}
+
+    @classmethod
+    def from_tagged_words(cls, tagged_words):
+        stats = cls()
+        p, d = None, None
+        for n in tagged_words:
+            if d is not None:
+                if d[1] == "DET":
+                    _count(stats.determiners, n[0], d[0])
+                if n[1] == "NOUN":
+                    if d[1] == "ADP":
+                        _count(stats.bigram_prepositions, n[0], d[0])
+                    if p is not None and d[1] == "DET" and p[1] == "ADP":
+                        _count(stats.trigram_prepositions, n[0], p[0] + "_" + d[0])
+            p, d = d, n
+        return stats
+
+    @classmethod
+    def from_encoded(cls, corpus:'EncodedCorpus', targets:set=None, context:int=0):
+        """Same counts as from_tagged_words, computed with array masks over an encoded corpus."""
+        det, adp, noun = corpus.tag_id("DET"), corpus.tag_id("ADP"), corpus.tag_id("NOUN")
+
+        (d, n), (dt, nt) = corpus.ngrams(2, context)
+        mask = dt == det
+        determiners = corpus.count_pairs(n[mask], d[mask], targets=targets)
+        mask = (nt == noun) & (dt == adp)
+        bigram_prepositions = corpus.count_pairs(n[mask], d[mask], targets=targets)
+
+        (p, d, n), (pt, dt, nt) = corpus.ngrams(3, context)
+        mask = (nt == noun) & (dt == det) & (pt == adp)
+        # the preposition and determiner pair is counted as a single choice
+        size = len(corpus.words)
+        words = corpus.words.tolist()
+        trigram_prepositions = corpus.count_pairs(
+            n[mask], p[mask].astype('int64') * size + d[mask],
+            choice_names=lambda c: words[c // size] + "_" + words[c % size],
+            targets=targets,
+        )
+
+        return cls(determiners, trigram_prepositions, bigram_prepositions)
+
+    @staticmethod
+    def _last_most_used(table:dict, target:str):
+        counts = table.get(target)
+        if not counts:
+            return ""
+        best, best_count = None, 0
+        for choice, count in counts.items():
+            if count >= best_count:
+                best, best_count = choice, count
+        return best
+
+    def merge(self, other:'NLGCorpusStats'):
+        """Adds the counts of other, collected from the corpus text following this one."""
+        _merge(self.determiners, other.determiners)
+        _merge(self.trigram_prepositions, other.trigram_prepositions)
+        _merge(self.bigram_prepositions, other.bigram_prepositions)
+
+    def determiner(self, target:str):
+        return self._last_most_used(self.determiners, target)
+
+    def trigram_preposition(self, target:str):
+        """Returns the most used "<preposition>_<determiner>" key before target."""
+        return self._last_most_used(self.trigram_prepositions, target)
+
+    def bigram_preposition(self, target:str):
+        return self._last_most_used(self.bigram_prepositions, target)
+
+    def most_used_determiners(self, targetset:set):
+        return _most_used(self.determiners, targetset)
+
+    def most_used_trigram_prepositions(self, targetset:set):
+        return _most_used(self.trigram_prepositions, targetset)
+
+    def most_used_bigram_prepositions(self, targetset:set):
+        return _most_used(self.bigram_prepositions, targetset)
+
+    def pruned(self):
+        """Statistics with the same lookup results, with only the choices they can return."""
+        return NLGCorpusStats(_prune(self.determiners), _prune(self.trigram_prepositions),
+                              _prune(self.bigram_prepositions))
+
+    def save(self, path:Path, prune:bool=True, corpus:str=BROWN_CORPUS):
+        stats = self.pruned() if prune else self
+        _save_tables(path, STATS_VERSION, corpus, {
+            "determiners": stats.determiners,
+            "trigram_prepositions": stats.trigram_prepositions,
+            "bigram_prepositions": stats.bigram_prepositions,
+        })
+
+    @classmethod
+    def load(cls, path:Path):
+        data = _load_tables(path, STATS_VERSION)
+        return cls(data["determiners"], data["trigram_prepositions"], data["bigram_prepositions"])
+
+
+# numpy and the encoded corpus are only loaded to count the statistics,
+# not to read them back
+
+def build_brown_stats():
+    from encodedcorpus import load_encoded_brown
+    return CorpusStats.from_encoded(load_encoded_brown())
+
+
+def build_brown_nlg_stats():
+    from encodedcorpus import load_encoded_brown
+    return NLGCorpusStats.from_encoded(load_encoded_brown())
+
+
+_loaded_stats = {}
+
+def _saved_corpus(path:Path):
+    """Name of the corpus the statistics file at path was counted from, None when unknown."""
+    try:
+        with open(path) as f:
+            return json.load(f).get("corpus")
+    except (ValueError, AttributeError):
+        return None
+
+def _load_cached(path:Path, stats_class, build):
+    key = str(path)
+    if key not in _loaded_stats:
+        stats = None
+        if os.path.isfile(path):
+            try:
+                stats = stats_class.load(path)
+            except (ValueError, KeyError) as e:
+                # only the Brown statistics can be counted again here
+                corpus = _saved_corpus(path)
+                if corpus != BROWN_CORPUS:
+                    raise ValueError(f'{path} holds statistics of the corpus {corpus or "unknown"} that can not '
+                                     f'be used: {e}. Run the stats job again, with --corpus for a text corpus, '
+                                     f'to count them.') from e
+                stats = None
+        if stats is None:
+            stats = build()
+            stats.save(path)
+        _loaded_stats[key] = stats
+
+    return _loaded_stats[key]
+
+def load_corpus_stats(path:Path=DEFAULT_STATS_FILE):
+    """
+    Returns the statistics stored at path, loading it only once per process.
+    The index is built from the Brown corpus and persisted when the file is
+    missing or holds outdated Brown statistics, statistics of another corpus
+    must be counted again by the stats job.
+    """
+    return _load_cached(path, CorpusStats, build_brown_stats)
+
+def load_nlg_stats(path:Path=DEFAULT_NLG_STATS_FILE):
+    """Like load_corpus_stats, for the statistics of NLGSentenceGenerator."""
+    return _load_cached(path, NLGCorpusStats, build_brown_nlg_stats)
+
+
+def add_arguments(parser:argparse.ArgumentParser):
+    parser.add_argument("--corpus", nargs="+", help="word/TAG text files or directories, the Brown corpus by default")
+    parser.add_argument("--separator", default="/", help="between a word and its universal tag")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=1000000, help="about how many tokens a worker counts per job")
+
+
+def run_from_args(args:argparse.Namespace):
+    if args.corpus:
+        from corpusbackend import TaggedTextCorpus, build_corpus_stats
+
+        stats, nlg_stats = build_corpus_stats(TaggedTextCorpus(args.corpus, args.separator), args.workers,
+                                              args.chunk_size)
+    else:
+        stats = build_brown_stats()
+        stats.save(DEFAULT_STATS_FILE)
+        nlg_stats = build_brown_nlg_stats()
+        nlg_stats.save(DEFAULT_NLG_STATS_FILE)
+
+    print(f'Saved statistics for {len(stats.determiners)} determiner and '
+          f'{len(stats.prepositions)} preposition targets to {DEFAULT_STATS_FILE}')
+    print(f'Saved statistics for {len(nlg_stats.determiners)} determiner and '
+          f'{len(nlg_stats.trigram_prepositions)} preposition targets to {DEFAULT_NLG_STATS_FILE}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Count the determiner and preposition statistics of a tagged corpus")
+    add_arguments(parser)
+    run_from_args(parser.parse_args())
@@ -0,0 +1,188 @@
+from pathlib import Path
+import os
+
+import numpy as np
+
+ENCODED_VERSION = 1
+DEFAULT_ENCODED_BROWN_FILE = Path("generated/cache/brown_encoded.npz")
+
+
+class EncodedCorpus:
+    """
+    A tagged corpus as integer arrays, so n-gram statistics can be counted
+    with vectorised masks instead of iterating word tuples.
+
+    words : np.ndarray
+        vocabulary, every distinct word of the corpus and its lowercase form
+    tags : np.ndarray
+        distinct tags
+    word_ids, tag_ids : np.ndarray
+        vocabulary and tag id of every corpus position
+    lower_ids : np.ndarray
+        for every vocabulary id, the id of its lowercase form
+    """
+    words: np.ndarray
+    tags: np.ndarray
+    word_ids: np.ndarray
+    tag_ids: np.ndarray
+    lower_ids: np.ndarray
+
+    def __init__(self, words:np.ndarray, tags:np.ndarray, word_ids:np.ndarray, tag_ids:np.ndarray,
+                 lower_ids:np.ndarray):
+        self.words = words
+        self.tags = tags
+        self.word_ids = word_ids
+        self.tag_ids = tag_ids
+        self.lower_ids = lower_ids
+        self._word_index = None
+
+    def __len__(self):
+        return len(self.word_ids)
+
+    @classmethod
+    def from_tagged_words(cls, tagged_words):
+        word_index = {}
+        tag_index = {}
+        word_ids = []
+        tag_ids = []
+        for word, tag in tagged_words:
+            i = word_index.get(word)
+            if i is None:
+                i = word_index[word] = len(word_index)
+            word_ids.append(i)
+            t = tag_index.get(tag)
+            if t is None:
+                t = tag_index[tag] = len(tag_index)
+            tag_ids.append(t)
+
+        for word in list(word_index):
+            lower = word.lower()
+            if lower not in word_index:
+                word_index[lower] = len(word_index)
+        lower_ids = [word_index[word.lower()] for word in word_index]
+
+        return cls(
+            np.array(list(word_index), dtype=str),
+            np.array(list(tag_index), dtype=str),
+            np.array(word_ids, dtype=np.int32),
+            np.array(tag_ids, dtype=np.int16),
+            np.array(lower_ids, dtype=np.int32),
+        )
+
+    def save(self, path:Path):
+        path = Path(path)
+        if not os.path.exists(path.parent):
+            os.makedirs(path.parent)
+
+        # np.savez appends .npz to names without it
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(tmp, version=np.array(ENCODED_VERSION), words=self.words, tags=self.tags,
+                 word_ids=self.word_ids, tag_ids=self.tag_ids, lower_ids=self.lower_ids)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path:Path):
+        with np.load(path) as data:
+            if int(data["version"]) != ENCODED_VERSION:
+                raise ValueError("Encoded corpus file has an incompatible version")
+            return cls(data["words"], data["tags"], data["word_ids"], data["tag_ids"], data["lower_ids"])
+
+    def word_id(self, word:str):
+        if self._word_index is None:
+            self._word_index = {w: i for i, w in enumerate(self.words.tolist())}
+        return self._word_index.get(word)
+
+    def tag_id(self, tag:str):
+        matches = np.flatnonzero(self.tags == tag)
+        # a tag missing from the corpus matches no position
+        return int(matches[0]) if len(matches) > 0 else -1
+
+    def word_set_mask(self, ids:np.ndarray, words:list):
+        """Mask of the positions of ids (vocabulary ids) holding one of words."""
+        targets = [i for i in (self.word_id(w) for w in words) if i is not None]
+        return np.isin(ids, np.array(targets, dtype=np.int32))
+
+    def ngrams(self, n:int, context:int=0):
+        """
+        (word_ids, tag_ids) views of every position of the n-grams, first
+        word first, e.g. ngrams(2) gives ((d, n), (d_tags, n_tags)).
+
+        context : int
+            number of leading positions that only precede the corpus, e.g.
+            the end of the previous chunk; n-grams ending in them are left out
+        """
+        start = max(0, context - n + 1)
+        size = len(self.word_ids) - n + 1 - start
+        if size <= 0:
+            empty = np.zeros(0, dtype=np.int32)
+            return tuple(empty for _ in range(n)), tuple(empty for _ in range(n))
+        words = tuple(self.word_ids[start + i:start + i + size] for i in range(n))
+        tags = tuple(self.tag_ids[start + i:start + i + size] for i in range(n))
+        return words, tags
+
+    def count_pairs(self, keys:np.ndarray, choices:np.ndarray, choice_names=None, targets:set=None):
+        """
+        Counts every (key, choice) vocabulary id pair, given as two aligned
+        arrays in corpus order, and returns {key word: {choice: count}}.
+        Both levels are in first seen order, like counting the pairs one by
+        one in a dict would give.
+
+        choice_names : function
+            maps a choice id to its name, the vocabulary word by default
+        targets : set
+            only count the keys in targets
+        """
+        if targets is not None:
+            mask = self.word_set_mask(keys, list(targets))
+            keys, choices = keys[mask], choices[mask]
+
+        table = {}
+        if len(keys) == 0:
+            return table
+
+        # choices are numbered by rank first, combined choice ids such as the
+        # trigram ones can be far larger than the number of pairs
+        choice_values, choice_ranks = np.unique(choices, return_inverse=True)
+        codes = keys.astype(np.int64) * len(choice_values) + choice_ranks.reshape(-1)
+        unique, first, counts = np.unique(codes, return_index=True, return_counts=True)
+        order = np.argsort(first, kind='stable')
+
+        words = self.words.tolist()
+        if choice_names is None:
+            choice_names = words.__getitem__
+        pair_keys = keys[first[order]].tolist()
+        pair_choices = choices[first[order]].tolist()
+        for key, choice, count in zip(pair_keys, pair_choices, counts[order].tolist()):
+            counts_of_key = table.get(words[key])
+            if counts_of_key is None:
+                counts_of_key = table[words[key]] = {}
+            counts_of_key[choice_names(choice)] = count
+        return table
+
+
+def encode_brown():
+    from nltk.corpus import brown
+    return EncodedCorpus.from_tagged_words(brown.tagged_words(tagset="universal"))
+
+
+_loaded_corpora = {}
+
+def load_encoded_brown(path:Path=DEFAULT_ENCODED_BROWN_FILE):
+    """
+    Returns the encoded Brown corpus, encoding and persisting it on first use.
+    Loaded only once per process.
+    """
+    key = str(path)
+    if key not in _loaded_corpora:
+        corpus = None
+        if os.path.isfile(path):
+            try:
+                corpus = EncodedCorpus.load(path)
+            except (ValueError, KeyError):
+                corpus = None
+        if corpus is None:
+            corpus = encode_brown()
+            corpus.save(path)
+        _loaded_corpora[key] = corpus
+
+    return _loaded_corpora[key]
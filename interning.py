@@ -0,0 +1,124 @@
+from array import array
+from typing import List
+
+
+class Interner:
+    """Maps every distinct string to a compact integer id, in first seen order."""
+    strings: list
+
+    def __init__(self, strings:list=None):
+        self.strings = list(strings) if strings else []
+        self._ids = {v: i for i, v in enumerate(self.strings)}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getstate__(self):
+        # the reverse mapping is rebuilt on load, halving the pickled size
+        return {'strings': self.strings}
+
+    def __setstate__(self, state):
+        self.__init__(state['strings'])
+
+    def intern(self, value:str):
+        i = self._ids.get(value)
+        if i is None:
+            i = self._ids[value] = len(self.strings)
+            self.strings.append(value)
+        return i
+
+    def get(self, value:str):
+        return self._ids.get(value)
+
+
+class EncodedAnnotation:
+    """
+    A SWiG annotation stored as integer ids of an InternTable.
+
+    verb : int
+    frames : List[array]
+        one array per frame holding role and noun ids interleaved,
+        [role, noun, role, noun, ...], with noun -1 for an empty value
+    bb_roles : array
+        role id of every bounding box, in annotation order
+    bb : array
+        int16 [x1, y1, x2, y2] of every bounding box, flattened
+    height, width : int
+        image size, -1 when missing
+    """
+    __slots__ = ('verb', 'frames', 'bb_roles', 'bb', 'height', 'width')
+
+    def __init__(self, verb:int, frames:List[array], bb_roles:array, bb:array, height:int=-1, width:int=-1):
+        self.verb = verb
+        self.frames = frames
+        self.bb_roles = bb_roles
+        self.bb = bb
+        self.height = height
+        self.width = width
+
+    def __getstate__(self):
+        return tuple(getattr(self, k) for k in self.__slots__)
+
+    def __setstate__(self, state):
+        for k, v in zip(self.__slots__, state):
+            setattr(self, k, v)
+
+
+class InternTable:
+    """
+    Shared integer ids of the role names, nouns (role values) and verbs seen
+    across a split. Ids are only meaningful together with the table that
+    produced them, so the table travels with anything keyed by them.
+    """
+    roles: Interner
+    nouns: Interner
+    verbs: Interner
+
+    def __init__(self):
+        self.roles = Interner()
+        self.nouns = Interner()
+        self.verbs = Interner()
+
+    def encode_frame(self, frame:dict):
+        encoded = array('i')
+        for role in frame:
+            encoded.append(self.roles.intern(role))
+            encoded.append(self.nouns.intern(frame[role]) if frame[role] != '' else -1)
+        return encoded
+
+    def decode_frame(self, encoded:array):
+        frame = {}
+        for i in range(0, len(encoded), 2):
+            noun = encoded[i + 1]
+            frame[self.roles.strings[encoded[i]]] = self.nouns.strings[noun] if noun >= 0 else ''
+        return frame
+
+    def encode_annotation(self, annotation:dict):
+        boxes = annotation.get('bb', {})
+        bb_roles = array('i', [self.roles.intern(r) for r in boxes])
+        bb = array('h')
+        for r in boxes:
+            bb.extend(boxes[r])
+
+        return EncodedAnnotation(
+            self.verbs.intern(annotation['verb']),
+            [self.encode_frame(f) for f in annotation['frames']],
+            bb_roles,
+            bb,
+            annotation.get('height', -1),
+            annotation.get('width', -1),
+        )
+
+    def decode_annotation(self, encoded:EncodedAnnotation):
+        bb = {}
+        for i, r in enumerate(encoded.bb_roles):
+            bb[self.roles.strings[r]] = list(encoded.bb[4 * i:4 * i + 4])
+
+        annotation = {'bb': bb}
+        if encoded.height >= 0:
+            annotation['height'] = encoded.height
+        if encoded.width >= 0:
+            annotation['width'] = encoded.width
+        annotation['verb'] = self.verbs.strings[encoded.verb]
+        annotation['frames'] = [self.decode_frame(f) for f in encoded.frames]
+        return annotation
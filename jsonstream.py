@@ -0,0 +1,221 @@
+import codecs
+import json
+import os
+import re
+from pathlib import Path
+
+CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# characters that can follow a complete value
+_DELIMITERS = frozenset(' \t\n\r,:}]')
+
+
+class _JsonObjectReader:
+    """
+    Incremental reader of a file holding a single top level JSON object.
+    Only the current chunk and the value being decoded are kept in memory,
+    and the byte offset of every value in the file is tracked so it can be
+    read back later on its own.
+    """
+
+    def __init__(self, f, chunk_size:int=CHUNK_SIZE):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ""
+        self._ascii = True
+        self._pos = 0
+        # byte offset in the file of the buffer position _mark
+        self._mark = 0
+        self._mark_offset = 0
+        self._eof = False
+
+    def byte_offset(self):
+        if self._ascii:
+            return self._mark_offset + self._pos - self._mark
+        # only the text consumed since the previous call is encoded
+        self._mark_offset += len(self._buf[self._mark:self._pos].encode('utf-8'))
+        self._mark = self._pos
+        return self._mark_offset
+
+    def _fill(self):
+        # drop the consumed part of the buffer before reading more
+        if self._pos > 0:
+            self._mark_offset = self.byte_offset()
+            self._mark = 0
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            self._buf += self._utf8.decode(b"", final=True)
+        else:
+            self._buf += self._utf8.decode(chunk)
+        self._ascii = self._buf.isascii()
+
+    def _skip_whitespace(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or self._eof:
+                return
+            self._fill()
+
+    def _expect(self, chars:str):
+        self._skip_whitespace()
+        if self._pos >= len(self._buf) or self._buf[self._pos] not in chars:
+            raise ValueError(f"Malformed JSON object, expected one of '{chars}' at byte {self.byte_offset()}")
+        c = self._buf[self._pos]
+        self._pos += 1
+        return c
+
+    def _decode_value(self):
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+
+            # a number or literal cut by the end of the chunk decodes as a
+            # shorter value, e.g. '1.' as 1, so it is only complete when a
+            # delimiter follows
+            if not self._eof and (end == len(self._buf) or self._buf[end] not in _DELIMITERS):
+                self._fill()
+                continue
+
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        """
+        Yields (key, value, start, end) with the [start, end) byte range of
+        every value of the object, in file order.
+        """
+        self._expect('{')
+        self._skip_whitespace()
+        if self._buf[self._pos:self._pos + 1] == '}':
+            return
+
+        while True:
+            key = self._decode_value()
+            if not isinstance(key, str):
+                raise ValueError("Malformed JSON object, keys must be strings")
+            self._expect(':')
+            self._skip_whitespace()
+            start = self.byte_offset()
+            value = self._decode_value()
+            yield key, value, start, self.byte_offset()
+
+            if self._expect(',}') == '}':
+                return
+
+
+class JsonObjectWriter:
+    """
+    Writes a top level JSON object one (key, value) pair at a time, producing
+    the same text as json.dumps of the whole dict. The file is written next
+    to path and only moved into place by close().
+    """
+    path: Path
+
+    def __init__(self, path:Path):
+        self.path = Path(path)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._file = open(self._tmp, mode='w')
+        self._file.write("{")
+        self._count = 0
+
+    def add(self, key:str, value):
+        if self._count > 0:
+            self._file.write(", ")
+        self._file.write(json.dumps(key) + ": " + json.dumps(value))
+        self._count += 1
+
+    def close(self):
+        self._file.write("}")
+        self._file.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp)
+
+
+def iter_json_items(path:Path, chunk_size:int=CHUNK_SIZE):
+    """
+    Yields the (key, value) pairs of the top level object of a JSON file
+    without loading the whole file.
+    """
+    with open(path, 'rb') as f:
+        for key, value, _, _ in _JsonObjectReader(f, chunk_size):
+            yield key, value
+
+
+class JsonObjectIndex:
+    """
+    Read only, dict like access to the top level object of a JSON file.
+    Only the byte range of every value is kept in memory, values are decoded
+    from the file when accessed.
+    """
+    path: Path
+
+    def __init__(self, path:Path, chunk_size:int=CHUNK_SIZE):
+        self.path = Path(path)
+        self._chunk_size = chunk_size
+        self._offsets = {}
+        self._file = None
+
+        with open(self.path, 'rb') as f:
+            for key, _, start, end in _JsonObjectReader(f, chunk_size):
+                self._offsets[key] = (start, end)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, key):
+        return key in self._offsets
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def keys(self):
+        return self._offsets.keys()
+
+    def __getitem__(self, key):
+        start, end = self._offsets[key]
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        self._file.seek(start)
+        return json.loads(self._file.read(end - start))
+
+    def get(self, key, default=None):
+        if key not in self._offsets:
+            return default
+        return self[key]
+
+    def items(self):
+        # a sequential pass is cheaper than seeking to every value
+        return iter_json_items(self.path, self._chunk_size)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getstate__(self):
+        # open file handles can not be shared with other processes
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded mapping dropping the least recently used entry once maxsize
+    entries are stored, counting the hits and misses of get(). A maxsize of
+    0 or less disables the bound. Instances pickle with their entries, so a
+    warm cache can be handed to other processes.
+    """
+    maxsize: int
+    hits: int
+    misses: int
+
+    def __init__(self, maxsize:int=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if 0 < self.maxsize < len(self._entries):
+            self._entries.popitem(last=False)
+
+    def items(self):
+        """(key, value) pairs from the least to the most recently used."""
+        return list(self._entries.items())
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
@@ -1,59 +1,98 @@
 from pathlib import Path
+import argparse
 import json
 import os
 from tqdm import tqdm
-import cv2
 
 # from SwigCaptions import SWiGCaptions
-from SwigCaptionsV2 import SwigCaptionV2
+from SwigCaptionsV2 import SwigCaptionV2, GENERATOR_VERSION, HYPERNYM_CACHE_SIZE, set_hypernym_cache
+from SwigCaptionsV2 import load_hypernym_cache, save_hypernym_cache
+from lrucache import LRUCache
+from wordnettable import DEFAULT_WORDNET_FILE, load_wordnet_table
+from captionwriter import BackgroundWriter, JsonlCaptionWriter, finalize_jsonl, write_atomic
+from parallel import generate_batches
+from manifest import annotation_digest, file_digest, load_manifest, save_manifest
+from jsonstream import JsonObjectIndex, iter_json_items
+from metrics import Metrics, enable_metrics, disable_metrics, timed
+from visualize import draw_boxes, show_image
 
 def save_captions_to_json(captions:dict, export_file:Path):
     a = {}
     if not os.path.isfile(export_file):
         for k in captions.keys():
             a[k] = captions[k]
-        with open(export_file, mode='w') as f:
-            f.write(json.dumps(a, indent=2))
+        write_atomic(export_file, json.dumps(a, indent=2))
     else:
         with open(export_file) as feedsjson:
             feeds = json.load(feedsjson)
 
         for k in captions.keys():
             feeds[k] = captions[k]
-        with open(export_file, mode='w') as f:
-            f.write(json.dumps(feeds, indent=2))
+        write_atomic(export_file, json.dumps(feeds, indent=2))
 
-def save_log(generator:SwigCaptionV2, current_batch:int, logfile: Path):
+def save_log(generator:SwigCaptionV2, current_batch:int, logfile: Path, output_format:str="json", output_bytes:int=None):
     log = {}
 
-    if not os.path.isfile(logfile):
-        log["target"] = str(generator.target_file)
-        log["n_keys"] = generator.n_items
-        log["total_batch"] = generator.total_batch
-        log["completed_batch"] = current_batch
-    else:
+    if os.path.isfile(logfile):
         with open(logfile) as feedsjson:
             log = json.load(feedsjson)
-        log["target"] = str(generator.target_file)
-        log["n_keys"] = generator.n_items
-        log["total_batch"] = generator.total_batch
-        log["completed_batch"] = current_batch
 
-    with open(logfile, mode='w') as f:
-        f.write(json.dumps(log, indent=2))
+    log["target"] = str(generator.target_file)
+    log["n_keys"] = generator.n_items
+    log["batch_size"] = generator.batch_size
+    log["seed"] = generator.seed
+    log["global_vocabulary"] = generator.vocabulary is not None
+    log["total_batch"] = generator.total_batch
+    log["completed_batch"] = current_batch
+    log["output_format"] = output_format
+    if output_bytes is not None:
+        log["output_bytes"] = output_bytes
+    else:
+        log.pop("output_bytes", None)
+
+    write_atomic(logfile, json.dumps(log, indent=2))
+
+def load_checkpoint(generator:SwigCaptionV2, logfile: Path, output_format:str="json"):
+    """
+    Returns the log of a previous run on the same target, or None when there
+    is nothing to resume. A log of the same target written with a different
+    number of keys, batch size, seed, vocabulary mode or output format can
+    not be resumed and raises.
+    """
+    if not os.path.isfile(logfile):
+        return None
+
+    with open(logfile) as f:
+        log = json.load(f)
+
+    if log.get("target") != str(generator.target_file):
+        return None
+
+    # logs written before the format was recorded only have output_bytes in jsonl mode
+    log.setdefault("output_format", "jsonl" if "output_bytes" in log else "json")
+
+    expected = {
+        "n_keys": generator.n_items,
+        "batch_size": generator.batch_size,
+        "seed": generator.seed,
+        "global_vocabulary": generator.vocabulary is not None,
+        "output_format": output_format,
+    }
+    for k in expected:
+        if log.get(k) != expected[k]:
+            raise ValueError(f'Checkpoint {logfile} does not match the current run: {k} is '
+                             f'{log.get(k)}, expected {expected[k]}. Run without resume to start over.')
+
+    return log
 
 def get_file_stats(rootpath="SWiG", annotation_file='dev.json'):
 
     root = Path(rootpath)
     annotationfile = root / 'SWiG_jsons' / annotation_file
 
-    with open(annotationfile) as f:
-        all_json = json.load(f)
-
     count = dict()
 
-    for item_key in all_json.keys():
-        item = all_json[item_key]
+    for item_key, item in iter_json_items(annotationfile):
         keys = item['bb'].keys()
         n_keys = len(keys)
         if n_keys in count:
@@ -70,8 +109,7 @@ def debug_batch_image(captions:dict, rootpath="SWiG", annotation_file='dev.json'
     imgdir = root / 'images_512'
     annotationfile = root / 'SWiG_jsons' / annotation_file
 
-    with open(annotationfile) as f:
-        all = json.load(f)
+    all = JsonObjectIndex(annotationfile)
 
     for key in captions:
         img_path = imgdir / key
@@ -79,23 +117,25 @@ def debug_batch_image(captions:dict, rootpath="SWiG", annotation_file='dev.json'
         annotation = all[key]
         print(annotation)
 
-        # read image
-        img = cv2.imread(str(img_path))
-
-        result = img.copy()
-        boxes = annotation['bb']
-        for bkey in boxes:
-            b = boxes[bkey]
-            cv2.rectangle(result, (b[0], b[1]), (b[2], b[3]), (0, 0, 255), 2)
+        result = draw_boxes(img_path, annotation)
 
         print(captions[key])
 
         # show thresh and result
-        cv2.imshow("bounding_box", result)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
-
-def run_generation_on_file(targettype, rootpath="SWiG", exportpath="generated/v2"):
+        show_image(result)
+
+def run_generation_on_file(targettype, rootpath="SWiG", exportpath="generated/v2", output_format="jsonl", workers=1, seed=1,
+                           global_vocabulary=False, resume=True, checkpoint_every=1, streaming=False, interned=False,
+                           collect_metrics=False, batch_size=20, write_queue=4):
+    """
+    collect_metrics : bool
+        Record the wall time, calls and items of every stage, the skipped
+        frames and the cache hit rates to <exportpath>/metrics.json.
+    write_queue : int
+        Number of finished batches waiting to be written by the background
+        writer before generation blocks, 0 to write every batch before
+        generating the next one.
+    """
     target_to_file = {
         "validation": "dev.json",
         "test" : "test.json",
@@ -108,38 +148,238 @@ def run_generation_on_file(targettype, rootpath="SWiG", exportpath="generated/v2
 
     exports = Path(exportpath)
     export_file = exports / targetfile
-    log_file = exports / "log.json"
+    stream_file = exports / (Path(targetfile).stem + ".jsonl")
+    manifest_file = exports / (Path(targetfile).stem + ".manifest.json")
+    log_file = exports / (Path(targetfile).stem + ".log.json")
+    metrics_file = exports / "metrics.json"
+
+    if output_format not in ("json", "jsonl"):
+        raise ValueError("Output format must be either json or jsonl")
 
     # ensure path
     if not os.path.exists(exports):
         os.makedirs(exports)
 
-    capgen = SwigCaptionV2(validation_file, batch_size=20)
+    metrics = enable_metrics(Metrics()) if collect_metrics else None
+
+    # hypernyms of the previous runs, handed to the workers
+    load_hypernym_cache()
+
+    capgen = SwigCaptionV2(validation_file, batch_size=batch_size, seed=seed, global_vocabulary=global_vocabulary,
+                           streaming=streaming, interned=interned)
+
+    completed_batch = 0
+    output_bytes = 0
+    if resume:
+        checkpoint = load_checkpoint(capgen, log_file, output_format)
+        if checkpoint is not None:
+            completed_batch = checkpoint["completed_batch"]
+            if output_format == "jsonl":
+                output_bytes = checkpoint["output_bytes"]
 
     total_item = 0
     total_skipped = 0
 
+    writer = None
+    if output_format == "jsonl":
+        # drop anything written after the checkpoint
+        writer = JsonlCaptionWriter(stream_file, offset=output_bytes)
+
+    def write_batch(captions):
+        with timed("output_write", items=len(captions)):
+            if writer:
+                writer.write(captions)
+            else:
+                save_captions_to_json(captions, export_file)
+
+    def checkpoint_batch(batch_number):
+        with timed("checkpoint"):
+            if writer:
+                writer.sync()
+                save_log(capgen, batch_number, log_file, output_format, output_bytes=writer.tell())
+            else:
+                save_log(capgen, batch_number, log_file, output_format)
+
     total_batch = capgen.total_batch
-    for i in tqdm(range(407, total_batch + 1)):
-    # for i in range(5, 6):
-        captions, skipped = capgen.read_and_generate_batch(i)
+    batch_numbers = range(completed_batch + 1, total_batch + 1)
+    # batch_numbers = range(5, 6)
+    # batches are written and checkpointed in order by a background thread,
+    # the queue is drained before returning, also when generation fails
+    background = BackgroundWriter(write_queue)
+    try:
+        for i, captions, skipped in tqdm(generate_batches(capgen, batch_numbers, workers), total=len(batch_numbers)):
+            total_item += len(captions)
+            total_skipped += skipped
+
+            # debug_batch_image(captions)
+
+            # time spent waiting for a free slot in the write queue
+            with timed("output_wait"):
+                background.submit(write_batch, captions)
+
+                if (i - completed_batch) % checkpoint_every == 0 or i == total_batch:
+                    background.submit(checkpoint_batch, i)
+    finally:
+        try:
+            background.close()
+        finally:
+            if writer:
+                writer.close()
+
+    if writer:
+        with timed("output_write"):
+            finalize_jsonl(stream_file, export_file)
+
+    # record what the captions were generated from for incremental runs
+    with timed("manifest", items=capgen.n_items):
+        save_manifest(manifest_file, manifest_digests(capgen))
+
+    save_hypernym_cache()
 
-        total_item += capgen.batch_size
-        total_skipped += skipped
+    print(f'Total {total_skipped} skipped out of {total_item}')
 
-        # debug_batch_image(captions)
+    if metrics is not None:
+        metrics.save(metrics_file)
+        disable_metrics()
+        print(f'Metrics saved to {metrics_file}')
+
+def manifest_digests(capgen:SwigCaptionV2):
+    """
+    annotation_digest of every image of capgen. The resolved nouns are only
+    part of it with a global vocabulary, captions resolved per batch depend
+    on their batch and are regenerated by the next incremental run.
+    """
+    load_wordnet_table()
+    wordnet_digest = file_digest(DEFAULT_WORDNET_FILE)
+
+    digests = {}
+    for key, annotation in capgen.iter_annotations():
+        resolved = capgen.resolved_nouns(key) if capgen.vocabulary is not None else None
+        digests[key] = annotation_digest(annotation, capgen.seed, GENERATOR_VERSION, resolved, wordnet_digest)
+    return digests
+
+def run_incremental_generation(targettype, rootpath="SWiG", exportpath="generated/v2", seed=1, streaming=False,
+                               interned=False, batch_size=20):
+    """
+    Regenerates only the images whose annotation, rolemaps entries, resolved
+    nouns, WordNet table, seed or generator version changed since the
+    previous run, according to the manifest stored next to the export, and
+    reuses the other captions. Nouns are resolved with the whole split as
+    context, so the output is the one of a full run with global_vocabulary,
+    also after the corpus statistics changed.
+    """
+    target_to_file = {
+        "validation": "dev.json",
+        "test" : "test.json",
+        "train": "train.json"
+    }
 
-        save_captions_to_json(captions, export_file)
-        save_log(capgen, i, log_file)
+    targetfile = target_to_file[targettype]
+    root = Path(rootpath)
+    validation_file = root / "SWiG_jsons" / targetfile
 
-    print(f'Total {total_skipped} skipped out of {total_item}')
+    exports = Path(exportpath)
+    export_file = exports / targetfile
+    manifest_file = exports / (Path(targetfile).stem + ".manifest.json")
 
+    # ensure path
+    if not os.path.exists(exports):
+        os.makedirs(exports)
 
-if __name__ == '__main__':
-    run_generation_on_file(
-        "test",
-        rootpath="SWiG",
-        exportpath="generated/v2",
-    )
-    # get_file_stats()
+    load_hypernym_cache()
+
+    capgen = SwigCaptionV2(validation_file, batch_size=batch_size, seed=seed, global_vocabulary=True,
+                           streaming=streaming, interned=interned)
+
+    previous = {}
+    if os.path.isfile(export_file):
+        with open(export_file) as f:
+            previous = json.load(f)
+    manifest = load_manifest(manifest_file)
 
+    digests = manifest_digests(capgen)
+    changed = [key for key in digests if key not in previous or manifest.get(key) != digests[key]]
+
+    generated = {}
+    total_skipped = 0
+    for start in tqdm(range(0, len(changed), capgen.batch_size)):
+        captions, skipped = capgen.generate_for_keys(changed[start:start + capgen.batch_size])
+        generated.update(captions)
+        total_skipped += skipped
+
+    output = {}
+    for key in digests:
+        output[key] = generated[key] if key in generated else previous[key]
+
+    write_atomic(export_file, json.dumps(output, indent=2))
+    save_manifest(manifest_file, digests)
+    save_hypernym_cache()
+
+    print(f'Regenerated {len(changed)} out of {len(digests)} items, {total_skipped} skipped')
+
+
+def add_arguments(parser:argparse.ArgumentParser):
+    parser.add_argument("--split", default="test", choices=["validation", "test", "train"])
+    parser.add_argument("--swig-dir", default="SWiG", help="directory holding SWiG_jsons")
+    parser.add_argument("--output-dir", default="generated/v2")
+    parser.add_argument("--output-format", default="jsonl", choices=["json", "jsonl"],
+                        help="jsonl appends every batch to a stream converted to json at the end")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--global-vocabulary", action="store_true",
+                        help="resolve the nouns of the whole split once instead of per batch")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="start from the first batch instead of the checkpoint in <split>.log.json")
+    parser.add_argument("--checkpoint-every", type=int, default=1,
+                        help="number of batches between two checkpoints")
+    parser.add_argument("--streaming", action="store_true",
+                        help="index the annotation file instead of loading it into memory")
+    parser.add_argument("--interned", action="store_true",
+                        help="keep the annotations in memory as integer ids instead of strings")
+    parser.add_argument("--hypernym-cache-size", type=int, default=HYPERNYM_CACHE_SIZE,
+                        help="number of nouns whose hypernyms are kept in memory, 0 for no limit")
+    parser.add_argument("--write-queue", type=int, default=4,
+                        help="finished batches queued for the background writer, 0 to write synchronously")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record per stage timings and counters to metrics.json next to the export")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only regenerate the items changed since the previous run, always with the global vocabulary")
+
+
+def run_from_args(args:argparse.Namespace):
+    set_hypernym_cache(LRUCache(args.hypernym_cache_size))
+
+    if args.incremental:
+        run_incremental_generation(
+            args.split,
+            rootpath=args.swig_dir,
+            exportpath=args.output_dir,
+            seed=args.seed,
+            streaming=args.streaming,
+            interned=args.interned,
+            batch_size=args.batch_size,
+        )
+    else:
+        run_generation_on_file(
+            args.split,
+            rootpath=args.swig_dir,
+            exportpath=args.output_dir,
+            output_format=args.output_format,
+            workers=args.workers,
+            seed=args.seed,
+            global_vocabulary=args.global_vocabulary,
+            resume=args.resume,
+            checkpoint_every=args.checkpoint_every,
+            streaming=args.streaming,
+            interned=args.interned,
+            collect_metrics=args.metrics,
+            batch_size=args.batch_size,
+            write_queue=args.write_queue,
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate captions for a SWiG split")
+    add_arguments(parser)
+    run_from_args(parser.parse_args())
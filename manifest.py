@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from rolemaps import SUBJECT_ROLES, AGENT_ROLES, OBJECT_ROLES, ROLE_PREPOSITION_MAP, PLURAL_NOUNS, VERB_FORM_MAPS
+from rolemaps import DETERMINERS_LIST
+from captionwriter import write_atomic
+
+MANIFEST_VERSION = 2
+
+
+def file_digest(path:Path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def annotation_digest(annotation:dict, seed:int, generator_version:str, resolved:dict=None,
+                      wordnet_digest:str=None):
+    """
+    Content hash of everything the captions of an image are generated from:
+    the verb and frames of the annotation, the rolemaps entries of its verb
+    and roles, the run seed and the generator version.
+
+    resolved : dict
+        formatted noun, determiner and preposition of every noun of the
+        annotation, see SwigCaptionV2.resolved_nouns. They depend on the
+        corpus statistics and on the other annotations they were resolved
+        with, so None (not resolved with the whole split) never matches a
+        resolved digest.
+    wordnet_digest : str
+        file_digest of the WordNet table the hypernyms are drawn from
+    """
+    verb = annotation['verb']
+    frames = annotation['frames']
+
+    roles = sorted({role for f in frames for role in f})
+    role_entries = {
+        r: [ROLE_PREPOSITION_MAP.get(r), r in AGENT_ROLES, r in SUBJECT_ROLES, r in OBJECT_ROLES]
+        for r in roles
+    }
+
+    payload = {
+        "verb": verb,
+        "frames": frames,
+        "verb_forms": VERB_FORM_MAPS.get(verb),
+        "roles": role_entries,
+        "plural_nouns": PLURAL_NOUNS,
+        "determiners": DETERMINERS_LIST,
+        "seed": seed,
+        "generator": generator_version,
+        "resolved": resolved,
+        "wordnet": wordnet_digest,
+    }
+    encoded = json.dumps(payload, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def load_manifest(path:Path):
+    if not os.path.isfile(path):
+        return {}
+
+    with open(path) as f:
+        manifest = json.load(f)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+
+    return manifest["images"]
+
+
+def save_manifest(path:Path, digests:dict):
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "images": digests,
+    }
+    write_atomic(path, json.dumps(manifest))
@@ -0,0 +1,102 @@
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+import json
+import time
+
+from captionwriter import write_atomic
+
+METRICS_VERSION = 1
+
+_NOT_TIMED = nullcontext()
+
+
+class Metrics:
+    """
+    Wall time, call count and items processed per pipeline stage, plus
+    free form counters. Counters named '<name>_hits' and '<name>_misses'
+    are reported as the hit rate of cache <name>.
+    """
+    stages: dict
+    counters: dict
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+
+    def add(self, stage:str, seconds:float, items:int=0, calls:int=1):
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = {"seconds": 0.0, "calls": 0, "items": 0}
+        entry["seconds"] += seconds
+        entry["calls"] += calls
+        entry["items"] += items
+
+    @contextmanager
+    def stage(self, name:str, items:int=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, items)
+
+    def count(self, name:str, n:int=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other:dict):
+        """Adds the stages and counters of another Metrics.to_dict(), e.g. from a worker process."""
+        for name, entry in other["stages"].items():
+            self.add(name, entry["seconds"], entry["items"], entry["calls"])
+        for name, n in other["counters"].items():
+            self.count(name, n)
+
+    def to_dict(self):
+        stages = {}
+        for name, entry in self.stages.items():
+            stages[name] = dict(entry)
+            stages[name]["items_per_sec"] = entry["items"] / entry["seconds"] if entry["seconds"] > 0 else 0.0
+
+        hit_rates = {}
+        for name in self.counters:
+            if name.endswith("_hits"):
+                cache = name[:-len("_hits")]
+                hits = self.counters[name]
+                total = hits + self.counters.get(cache + "_misses", 0)
+                hit_rates[cache] = hits / total if total > 0 else 0.0
+
+        return {
+            "version": METRICS_VERSION,
+            "wall_seconds": time.perf_counter() - self._start,
+            "stages": stages,
+            "counters": dict(self.counters),
+            "cache_hit_rates": hit_rates,
+        }
+
+    def save(self, path:Path):
+        write_atomic(path, json.dumps(self.to_dict(), indent=2))
+
+
+# collector of this process, None when instrumentation is disabled
+_active = None
+
+def enable_metrics(metrics:Metrics=None):
+    global _active
+    _active = metrics if metrics is not None else Metrics()
+    return _active
+
+def disable_metrics():
+    global _active
+    _active = None
+
+def active_metrics():
+    return _active
+
+def timed(stage:str, items:int=0):
+    """Times the enclosed block as stage when metrics are enabled, does nothing otherwise."""
+    if _active is None:
+        return _NOT_TIMED
+    return _active.stage(stage, items)
+
+def count(name:str, n:int=1):
+    if _active is not None:
+        _active.count(name, n)
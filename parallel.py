@@ -0,0 +1,88 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+from corpusstats import load_corpus_stats, DEFAULT_STATS_FILE
+from wordnettable import load_wordnet_table
+from SwigCaptionsV2 import SwigCaptionV2, SwigVocabulary, generate_batch_captions, get_hypernym_cache, set_hypernym_cache
+from SwigCaptionsV2 import merge_hypernyms, take_hypernym_updates
+from interning import InternTable
+from lrucache import LRUCache
+from metrics import Metrics, active_metrics, enable_metrics, timed
+
+# batches queued per worker, bounds the annotations held by the pool
+PENDING_PER_WORKER = 4
+
+_worker_vocabulary = None
+_worker_table = None
+_worker_metrics = False
+
+
+def _init_worker(stats_file, vocabulary:SwigVocabulary, table:InternTable, hypernym_cache:LRUCache,
+                 collect_metrics:bool=False):
+    # every worker loads the corpus statistics and receives the split
+    # vocabulary, intern table and the hypernyms already looked up by the
+    # parent once, and reuses them for all the batches it processes
+    global _worker_vocabulary, _worker_table, _worker_metrics
+    load_corpus_stats(stats_file)
+    load_wordnet_table()
+    set_hypernym_cache(hypernym_cache)
+    # start recording the hypernyms looked up, they are sent back with every batch
+    take_hypernym_updates()
+    _worker_vocabulary = vocabulary
+    _worker_table = table
+    _worker_metrics = collect_metrics
+
+
+def _generate_batch(batch_data:dict, seed:int):
+    # the metrics of every batch are sent back to be merged by the parent
+    metrics = enable_metrics(Metrics()) if _worker_metrics else None
+    captions, skipped = generate_batch_captions(batch_data, seed=seed, vocabulary=_worker_vocabulary,
+                                                table=_worker_table)
+    return captions, skipped, metrics.to_dict() if metrics is not None else None, take_hypernym_updates()
+
+
+def _batch_result(future, metrics:Metrics):
+    captions, skipped, worker_metrics, hypernyms = future.result()
+    if worker_metrics is not None:
+        metrics.merge(worker_metrics)
+    # kept by the parent for the next run, see save_hypernym_cache
+    merge_hypernyms(hypernyms)
+    return captions, skipped
+
+
+def generate_batches(capgen:SwigCaptionV2, batch_numbers:Iterable[int], workers:int=1):
+    """
+    Yields (batch_number, captions, skipped) for every batch number, in the
+    given order. With more than one worker the batches are generated by a
+    process pool; since every image draws from its own seeded generator the
+    output is the same as in a serial run. When metrics are enabled the
+    stage timings of the workers are merged into the active collector, and
+    the hypernyms they look up are merged into the cache of this process.
+    """
+    if workers <= 1:
+        for i in batch_numbers:
+            captions, skipped = capgen.read_and_generate_batch(i)
+            yield i, captions, skipped
+        return
+
+    # build the statistics files once before the workers start reading them
+    load_corpus_stats(DEFAULT_STATS_FILE)
+    load_wordnet_table()
+
+    metrics = active_metrics()
+    initargs = (DEFAULT_STATS_FILE, capgen.vocabulary, capgen.table, get_hypernym_cache(), metrics is not None)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        pending = deque()
+        for i in batch_numbers:
+            with timed("batch_read"):
+                batch_data = capgen.get_batch_data(i)
+            pending.append((i, pool.submit(_generate_batch, batch_data, capgen.seed)))
+
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                n, future = pending.popleft()
+                yield (n,) + _batch_result(future, metrics)
+
+        while pending:
+            n, future = pending.popleft()
+            yield (n,) + _batch_result(future, metrics)
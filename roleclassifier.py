@@ -0,0 +1,126 @@
+from typing import List
+import weakref
+
+from interning import InternTable
+from rolemaps import SUBJECT_ROLES, AGENT_ROLES, OBJECT_ROLES, ROLE_PREPOSITION_MAP
+
+PLACE_ROLE = 'place'
+
+# subject priority of a role, lower is chosen first
+SUBJECT_AGENT = 0
+SUBJECT_LISTED = 1
+SUBJECT_SUFFIX = 2
+SUBJECT_OTHER = 3
+NOT_SUBJECT = 4
+
+# object priority of a role, lower is chosen first
+OBJECT_LISTED = 0
+OBJECT_SUFFIX = 1
+NOT_OBJECT = 2
+
+
+class RoleClass:
+    """
+    Everything caption generation needs to know about a role name, derived
+    once from rolemaps.
+
+    subject_rank : int
+        agent roles, then SUBJECT_ROLES, then roles ending in er/ers, then any
+        other role but place
+    object_rank : int
+        OBJECT_ROLES, then roles ending in item/items
+    is_agent, is_place : bool
+    preposition : str
+        ROLE_PREPOSITION_MAP entry of the role, None when it has none
+    plural : bool
+        the role name itself is plural, e.g. agents
+    """
+    __slots__ = ('name', 'subject_rank', 'object_rank', 'is_agent', 'is_place', 'preposition', 'plural')
+
+    def __init__(self, name:str):
+        self.name = name
+        self.is_agent = name in AGENT_ROLES
+        self.is_place = name == PLACE_ROLE
+        self.preposition = ROLE_PREPOSITION_MAP.get(name)
+        self.plural = name.endswith('s')
+
+        if self.is_agent:
+            self.subject_rank = SUBJECT_AGENT
+        elif name in SUBJECT_ROLES:
+            self.subject_rank = SUBJECT_LISTED
+        elif name.endswith("er") or name.endswith("ers"):
+            self.subject_rank = SUBJECT_SUFFIX
+        elif not self.is_place:
+            self.subject_rank = SUBJECT_OTHER
+        else:
+            self.subject_rank = NOT_SUBJECT
+
+        if name in OBJECT_ROLES:
+            self.object_rank = OBJECT_LISTED
+        elif name.endswith("item") or name.endswith("items"):
+            self.object_rank = OBJECT_SUFFIX
+        else:
+            self.object_rank = NOT_OBJECT
+
+
+class RoleClassifier:
+    """
+    Role classes indexed like a list of role names, usually the roles
+    Interner of an InternTable; extend() classifies the names added since.
+    """
+    classes: List[RoleClass]
+
+    def __init__(self, names:List[str]=None):
+        self.classes = []
+        self._names = names if names is not None else []
+        self.extend()
+
+    def extend(self):
+        for name in self._names[len(self.classes):]:
+            self.classes.append(RoleClass(name))
+
+    def __getitem__(self, role_id:int):
+        return self.classes[role_id]
+
+    def select(self, roles:List[int]):
+        """
+        Picks the subject, place and object of a frame in a single pass over
+        its non empty role ids. Returns their indices into roles, or None.
+        The object is never the role chosen as subject or place.
+        """
+        classes = self.classes
+        subject = place = None
+        subject_rank = NOT_SUBJECT
+        # best two object candidates, as one of them may be the subject
+        first = second = None
+        first_rank = second_rank = NOT_OBJECT
+
+        for i, r in enumerate(roles):
+            c = classes[r]
+            if c.subject_rank < subject_rank:
+                subject, subject_rank = i, c.subject_rank
+            if c.is_place and place is None:
+                place = i
+            if c.object_rank < first_rank:
+                second, second_rank = first, first_rank
+                first, first_rank = i, c.object_rank
+            elif c.object_rank < second_rank:
+                second, second_rank = i, c.object_rank
+
+        obj = first if first != subject else second
+        return subject, place, obj
+
+
+# classifier of every live InternTable, so its roles are classified only once
+_table_classifiers = weakref.WeakKeyDictionary()
+
+def table_classifier(table:InternTable):
+    """
+    The RoleClassifier of the roles of table, shared by every generator
+    using the table and extended with the roles interned since its last use.
+    """
+    classifier = _table_classifiers.get(table)
+    if classifier is None:
+        classifier = _table_classifiers[table] = RoleClassifier(table.roles.strings)
+    classifier.extend()
+    return classifier
@@ -1,3 +1,5 @@
+DETERMINERS_LIST = ['a', 'an', 'the']
+
 
 SUBJECT_ROLES = [
     "boaters", "substance", "seller", "victim", "farmer",
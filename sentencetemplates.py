@@ -0,0 +1,90 @@
+from rolemaps import VERB_FORM_MAPS
+
+
+class SentenceTemplates:
+    """
+    Caption shapes compiled into str.format strings on first use. A shape is
+    the verb, its voice and verb phrase, and which of the object, compliment
+    and place slots a frame fills; rendering a frame only fills the slots:
+
+        active:  "{0} <verb phrase> {1} {2} {3}"
+        passive: "{1} is getting <participle> by {0} {2} {3}"
+
+    with {0} the subject, {1} the object, {2} the joined compliments and {3}
+    the place, absent slots being left out of the string.
+    """
+    verb_forms: dict
+
+    def __init__(self, verb_forms:dict=VERB_FORM_MAPS):
+        self.verb_forms = verb_forms
+        self._verb_phrases = {}
+        self._passive_phrases = {}
+        self._templates = {}
+
+    def verb_phrase(self, verb:str, plural:bool, use_form:bool):
+        """
+        use_form : bool
+            use the present tense form of VERB_FORM_MAPS, e.g. 'eats',
+            instead of 'is eating'
+        """
+        key = (verb, plural, use_form)
+        phrase = self._verb_phrases.get(key)
+        if phrase is None:
+            if use_form and verb in self.verb_forms:
+                verb_forms = self.verb_forms[verb]
+                phrase = verb_forms[0] if plural else verb_forms[1]
+            else:
+                phrase = ('are ' if plural else 'is ') + verb
+            self._verb_phrases[key] = phrase
+        return phrase
+
+    def passive_phrase(self, verb:str):
+        phrase = self._passive_phrases.get(verb)
+        if phrase is None:
+            if verb not in self.verb_forms:
+                raise ValueError("Verb not found")
+
+            verb_forms = self.verb_forms[verb]
+            verb_tense = verb_forms[0] + 'ed'
+            if verb_forms[0].endswith('e'):
+                verb_tense = verb_forms[0] + 'd'
+            phrase = self._passive_phrases[verb] = "getting " + verb_tense + ' by'
+        return phrase
+
+    def template(self, verb:str, verb_phrase:str, passive:bool, has_object:bool, has_compliments:bool,
+                 has_place:bool):
+        """
+        Returns the compiled formatter of a shape, called with
+        (subject, object, compliments, place).
+        """
+        if passive:
+            # the passive voice does not depend on the active verb phrase
+            verb_phrase = None
+        key = (verb, verb_phrase, passive, has_object, has_compliments, has_place)
+        template = self._templates.get(key)
+        if template is None:
+            if passive:
+                parts = ["{1}", "is " + _escape(self.passive_phrase(verb)), "{0}"]
+            else:
+                parts = ["{0}", _escape(verb_phrase)]
+                if has_object:
+                    parts.append("{1}")
+            if has_compliments:
+                parts.append("{2}")
+            if has_place:
+                parts.append("{3}")
+            template = self._templates[key] = " ".join(parts).format
+        return template
+
+    def render(self, verb:str, verb_phrase:str, passive:bool, subject:str, object_phrase:str, compliments:list,
+               place:str):
+        template = self.template(verb, verb_phrase, passive, object_phrase != "", len(compliments) > 0, place != "")
+        return template(subject, object_phrase, " ".join(compliments), place)
+
+
+def _escape(text:str):
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+# shared by all the generators of a process
+SENTENCE_TEMPLATES = SentenceTemplates()
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from SwigCaptionsV2 import SwigCaptionV2
+
+N_IMAGES = 23
+
+
+@pytest.fixture
+def split_file(tmp_path):
+    annotations = {}
+    for i in range(N_IMAGES):
+        annotations["img_{:03d}.jpg".format(N_IMAGES - i)] = {
+            "bb": {"agent": [0, 0, 10, 10]}, "height": 512, "width": 512, "verb": "eating",
+            "frames": [{"agent": "n10287213"}],
+        }
+    path = tmp_path / "dev.json"
+    path.write_text(json.dumps(annotations))
+    return path
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, N_IMAGES, N_IMAGES + 5])
+@pytest.mark.parametrize("mode", [{}, {"streaming": True}, {"interned": True}])
+def test_every_key_once_in_file_order(split_file, batch_size, mode):
+    with open(split_file) as f:
+        file_keys = list(json.load(f))
+
+    capgen = SwigCaptionV2(split_file, batch_size, **mode)
+    assert capgen.total_batch == -(-N_IMAGES // batch_size)
+
+    batches = list(capgen.iter_batches())
+    assert [number for number, _ in batches] == list(range(1, capgen.total_batch + 1))
+    assert all(0 < len(keys) <= batch_size for _, keys in batches)
+
+    keys = [key for _, batch in batches for key in batch]
+    assert keys == file_keys
+    assert [key for number, _ in batches for key in capgen.batch_keys(number)] == file_keys
+
+
+def test_batch_number_out_of_range(split_file):
+    capgen = SwigCaptionV2(split_file, 7)
+    with pytest.raises(IndexError):
+        capgen.batch_keys(0)
+    with pytest.raises(IndexError):
+        capgen.batch_keys(capgen.total_batch + 1)
+
+
+def test_iter_batches_from_a_checkpoint(split_file):
+    capgen = SwigCaptionV2(split_file, 7)
+    resumed = [key for _, batch in capgen.iter_batches(start_batch=3) for key in batch]
+    assert resumed == capgen.keys_in_range(14, N_IMAGES)
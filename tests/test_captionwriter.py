@@ -0,0 +1,82 @@
+import json
+import threading
+
+import pytest
+
+from captionwriter import BackgroundWriter, JsonlCaptionWriter, finalize_jsonl, read_jsonl_captions
+
+
+def test_resume_drops_lines_after_checkpoint(tmp_path):
+    path = tmp_path / "dev.jsonl"
+    with JsonlCaptionWriter(path) as writer:
+        writer.write({"a.jpg": ["a"]})
+        offset = writer.tell()
+        writer.write({"b.jpg": ["b"]})
+
+    with JsonlCaptionWriter(path, offset=offset) as writer:
+        writer.write({"c.jpg": ["c"]})
+
+    assert read_jsonl_captions(path) == {"a.jpg": ["a"], "c.jpg": ["c"]}
+    export = tmp_path / "dev.json"
+    assert finalize_jsonl(path, export) == 2
+    assert json.loads(export.read_text()) == {"a.jpg": ["a"], "c.jpg": ["c"]}
+
+
+@pytest.mark.parametrize("remaining", [None, 3])
+def test_refuses_stream_shorter_than_checkpoint(tmp_path, remaining):
+    path = tmp_path / "dev.jsonl"
+    with JsonlCaptionWriter(path) as writer:
+        writer.write({"a.jpg": ["a"]})
+        offset = writer.tell()
+
+    if remaining is None:
+        path.unlink()
+    else:
+        path.write_bytes(path.read_bytes()[:remaining])
+
+    with pytest.raises(ValueError):
+        JsonlCaptionWriter(path, offset=offset)
+    assert not path.exists() or b"\0" not in path.read_bytes()
+
+
+@pytest.mark.parametrize("max_pending", [0, 1, 4])
+def test_background_writes_in_order(max_pending):
+    written = []
+    with BackgroundWriter(max_pending) as background:
+        for i in range(50):
+            background.submit(written.append, i)
+    assert written == list(range(50))
+
+
+@pytest.mark.parametrize("max_pending", [0, 4])
+def test_failed_write_drops_the_later_checkpoint(max_pending):
+    written = []
+
+    def write(batch):
+        if batch == 2:
+            raise OSError("disk full")
+        written.append(batch)
+
+    # the error is raised by a later submit or by close, depending on timing
+    with pytest.raises(OSError):
+        with BackgroundWriter(max_pending) as background:
+            for batch in range(1, 4):
+                background.submit(write, batch)
+            background.submit(written.append, "checkpoint")
+    assert written == [1]
+
+
+def test_close_drains_the_queue_when_generation_fails():
+    written = []
+    release = threading.Event()
+
+    with pytest.raises(RuntimeError):
+        with BackgroundWriter(4) as background:
+            # the first write blocks so the others are still queued
+            background.submit(release.wait)
+            for batch in range(3):
+                background.submit(written.append, batch)
+            # released only once generation failed and close is waiting
+            threading.Timer(0.05, release.set).start()
+            raise RuntimeError("generation failed")
+    assert written == [0, 1, 2]
@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from SwigCaptionsV2 import SwigCaptionV2
+from main import load_checkpoint, save_log
+
+
+@pytest.fixture
+def capgen(tmp_path):
+    annotations = {
+        "img_{}.jpg".format(i): {"bb": {"agent": [0, 0, 10, 10]}, "height": 512, "width": 512, "verb": "eating",
+                                 "frames": [{"agent": "n10287213"}]}
+        for i in range(5)
+    }
+    path = tmp_path / "dev.json"
+    path.write_text(json.dumps(annotations))
+    return SwigCaptionV2(path, batch_size=2)
+
+
+@pytest.mark.parametrize("written, resumed", [("jsonl", "json"), ("json", "jsonl")])
+def test_refuses_other_output_format(tmp_path, capgen, written, resumed):
+    log_file = tmp_path / "dev.log.json"
+    save_log(capgen, 2, log_file, written, output_bytes=10 if written == "jsonl" else None)
+
+    assert load_checkpoint(capgen, log_file, written)["completed_batch"] == 2
+    with pytest.raises(ValueError, match="output_format"):
+        load_checkpoint(capgen, log_file, resumed)
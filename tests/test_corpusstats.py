@@ -0,0 +1,147 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+import corpusstats
+from corpusstats import CorpusStats, NLGCorpusStats, PLACE_PREPOSITIONS
+from corpusbackend import TaggedCorpus, TaggedTextCorpus, count_corpus_stats
+from encodedcorpus import EncodedCorpus
+
+WORDS = ['the', 'The', 'a', 'an', 'this', 'of', 'in', 'on', 'at', 'by', 'with', 'dog', 'Dog', 'cat', 'park', 'café']
+TAGS = ['DET', 'ADP', 'NOUN', 'VERB', '.']
+
+
+def tagged_words(seed:int, n:int=3000):
+    r = random.Random(seed)
+    return [(r.choice(WORDS), r.choice(TAGS)) for _ in range(n)]
+
+
+def tables(stats):
+    # same content and the same order
+    return json.dumps(stats.__dict__)
+
+
+class ListCorpus(TaggedCorpus):
+    name = "list"
+
+    def __init__(self, words):
+        self.words = words
+
+    def iter_tagged_words(self):
+        return iter(self.words)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_encoded_counts_match_sequential_scan(seed):
+    words = tagged_words(seed)
+    corpus = EncodedCorpus.from_tagged_words(words)
+    assert tables(CorpusStats.from_encoded(corpus)) == tables(CorpusStats.from_tagged_words(words))
+    assert tables(NLGCorpusStats.from_encoded(corpus)) == tables(NLGCorpusStats.from_tagged_words(words))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_pruned_lookups_unchanged(seed):
+    words = tagged_words(seed, 300)
+    stats = CorpusStats.from_tagged_words(words)
+    pruned = stats.pruned()
+    nouns = set(stats.determiners) | set(stats.prepositions) | {"missing"}
+    assert pruned.most_used_determiners(nouns) == stats.most_used_determiners(nouns)
+    assert pruned.most_used_prepositions(nouns) == stats.most_used_prepositions(nouns)
+    assert (pruned.most_used_prepositions(nouns, PLACE_PREPOSITIONS)
+            == stats.most_used_prepositions(nouns, PLACE_PREPOSITIONS))
+
+    nlg_stats = NLGCorpusStats.from_tagged_words(words)
+    nlg_pruned = nlg_stats.pruned()
+    for noun in set(nlg_stats.determiners) | set(nlg_stats.trigram_prepositions) | {"missing"}:
+        assert nlg_pruned.determiner(noun) == nlg_stats.determiner(noun)
+        assert nlg_pruned.trigram_preposition(noun) == nlg_stats.trigram_preposition(noun)
+        assert nlg_pruned.bigram_preposition(noun) == nlg_stats.bigram_preposition(noun)
+    assert nlg_pruned.most_used_determiners(nouns) == nlg_stats.most_used_determiners(nouns)
+
+
+@pytest.mark.parametrize("workers,chunk_size", [(1, 1), (1, 7), (2, 2), (3, 50), (1, 10 ** 6)])
+def test_chunked_counts_match_sequential_scan(workers, chunk_size):
+    words = tagged_words(workers * chunk_size)
+    stats, nlg_stats = count_corpus_stats(ListCorpus(words), workers, chunk_size)
+    assert tables(stats) == tables(CorpusStats.from_tagged_words(words))
+    assert tables(nlg_stats) == tables(NLGCorpusStats.from_tagged_words(words))
+
+
+@pytest.mark.parametrize("workers,chunk_size", [(1, 1), (1, 3), (2, 5), (1, 10 ** 6)])
+def test_text_corpus_parts_match_sequential_scan(tmp_path, workers, chunk_size):
+    words = tagged_words(chunk_size, 2000)
+    r = random.Random(chunk_size)
+    # spread over files of a directory and a single file, with uneven lines
+    (tmp_path / "dir").mkdir()
+    cuts = [0, 1, 2, 700, 1500, 2000]
+    paths = [tmp_path / "dir" / "b.txt", tmp_path / "dir" / "a.txt", tmp_path / "dir" / "c.txt",
+             tmp_path / "d.txt", tmp_path / "e.txt"]
+    for path, start, end in zip(paths, cuts, cuts[1:]):
+        lines, line = [], []
+        for word, tag in words[start:end]:
+            line.append(word + "/" + tag)
+            if r.random() < 0.1:
+                lines.append(" ".join(line))
+                line = []
+        lines.append(" ".join(line))
+        path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+
+    corpus = TaggedTextCorpus([tmp_path / "dir", tmp_path / "d.txt", tmp_path / "e.txt"])
+    # directory files are read in name order
+    expected = words[1:2] + words[0:1] + words[2:]
+    assert list(corpus.iter_tagged_words()) == expected
+
+    stats, nlg_stats = count_corpus_stats(corpus, workers, chunk_size)
+    assert tables(stats) == tables(CorpusStats.from_tagged_words(expected))
+    assert tables(nlg_stats) == tables(NLGCorpusStats.from_tagged_words(expected))
+
+
+def test_load_refuses_other_place_prepositions(tmp_path, monkeypatch):
+    stats = CorpusStats({}, {"park": {"near": 3, "at": 2, "in": 1}})
+    path = tmp_path / "stats.json"
+    stats.save(path)
+    assert CorpusStats.load(path).most_used_prepositions({"park"}, PLACE_PREPOSITIONS) == {"park": "at"}
+
+    # the pruned file no longer has "in", the most used of the new list
+    monkeypatch.setattr(corpusstats, "PLACE_PREPOSITIONS", ["in", "on"])
+    with pytest.raises(ValueError):
+        CorpusStats.load(path)
+
+
+def test_outdated_text_corpus_statistics_are_not_replaced(tmp_path, monkeypatch):
+    path = tmp_path / "stats.json"
+    CorpusStats({}, {"park": {"in": 1}}).save(path, corpus="texts")
+    saved = path.read_text()
+
+    monkeypatch.setattr(corpusstats, "STATS_VERSION", corpusstats.STATS_VERSION + 1)
+    monkeypatch.setattr(corpusstats, "_loaded_stats", {})
+    monkeypatch.setattr(corpusstats, "build_brown_stats", lambda: pytest.fail("rebuilt from Brown"))
+    with pytest.raises(ValueError, match="texts"):
+        corpusstats.load_corpus_stats(path)
+    assert path.read_text() == saved
+
+
+def test_outdated_brown_statistics_are_rebuilt(tmp_path, monkeypatch):
+    path = tmp_path / "stats.json"
+    CorpusStats({}, {"park": {"in": 1}}).save(path)
+
+    monkeypatch.setattr(corpusstats, "STATS_VERSION", corpusstats.STATS_VERSION + 1)
+    monkeypatch.setattr(corpusstats, "_loaded_stats", {})
+    monkeypatch.setattr(corpusstats, "build_brown_stats", lambda: CorpusStats({}, {"park": {"on": 1}}))
+    stats = corpusstats.load_corpus_stats(path)
+    assert stats.most_used_prepositions({"park"}) == {"park": "on"}
+    assert CorpusStats.load(path).prepositions == stats.prepositions
+
+
+def test_count_pairs_with_large_choice_ids():
+    corpus = EncodedCorpus.from_tagged_words(tagged_words(0, 50))
+    # combined choice ids so large that key * (max choice + 1) overflows int64,
+    # and keys 0 and 2 with the same choice would collide
+    large = (1 << 63) - 1
+    keys = np.array([1, 0, 2, 2], dtype=np.int32)
+    choices = np.array([large, 7, 7, large], dtype=np.int64)
+    table = corpus.count_pairs(keys, choices, choice_names=str)
+    words = corpus.words.tolist()
+    assert table == {words[1]: {str(large): 1}, words[0]: {"7": 1}, words[2]: {"7": 1, str(large): 1}}
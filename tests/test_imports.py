@@ -0,0 +1,11 @@
+import bench
+
+
+def test_entry_points_import_within_budget():
+    # also fails when an entry point loads one of bench.LAZY_MODULES
+    assert bench.check_imports()
+
+
+def test_lazy_module_detected():
+    _, loaded = bench.measure_import("columnar", repeat=1)
+    assert loaded == ["numpy"]
@@ -0,0 +1,58 @@
+import io
+import json
+
+import pytest
+
+from jsonstream import _JsonObjectReader, JsonObjectIndex, iter_json_items
+
+SAMPLE = {
+    "a": 1.5, "b": 2e3, "c": -0.25E-2, "d": 10, "e": [1.25, -3, 4e+1], "f": {"g": 7.0},
+    "h": True, "i": None, "j": "café 1.5", "k": 123456789, "l": [], "m": {},
+}
+
+
+def read(text:str, chunk_size:int):
+    return [(key, value) for key, value, _, _ in _JsonObjectReader(io.BytesIO(text.encode('utf-8')), chunk_size)]
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(SAMPLE),
+    json.dumps(SAMPLE, indent=2),
+    json.dumps(SAMPLE, separators=(",", ":")),
+    json.dumps(SAMPLE, ensure_ascii=False),
+])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 6, 8, 9, 18, 1 << 20])
+def test_values_split_across_chunks(text, chunk_size):
+    assert read(text, chunk_size) == list(json.loads(text).items())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 20])
+def test_empty_object(chunk_size):
+    assert read("{}", chunk_size) == []
+    assert read(" { } ", chunk_size) == []
+
+
+@pytest.mark.parametrize("text", ['{"a": 1.5 "b": 2}', '{"a": 1x}', '{"a": 1', '[1, 2]'])
+def test_malformed(text):
+    with pytest.raises(ValueError):
+        read(text, 2)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+def test_index_reads_values_back(tmp_path, chunk_size):
+    path = tmp_path / "sample.json"
+    path.write_text(json.dumps(SAMPLE, ensure_ascii=False), encoding='utf-8')
+
+    assert list(iter_json_items(path, chunk_size)) == list(SAMPLE.items())
+    with JsonObjectIndex(path, chunk_size) as index:
+        assert list(index) == list(SAMPLE)
+        for key, value in SAMPLE.items():
+            assert index[key] == value
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 7, 1 << 20])
+def test_byte_offsets_after_non_ascii(chunk_size):
+    sample = {"é": "ü", **SAMPLE, "€": ["日本", 1.5]}
+    data = json.dumps(sample, ensure_ascii=False).encode('utf-8')
+    for key, value, start, end in _JsonObjectReader(io.BytesIO(data), chunk_size):
+        assert json.loads(data[start:end]) == value == sample[key]
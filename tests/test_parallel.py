@@ -0,0 +1,67 @@
+import json
+import multiprocessing
+import random
+
+import pytest
+
+import corpusstats
+import SwigCaptionsV2
+import wordnettable
+from corpusstats import CorpusStats, DEFAULT_STATS_FILE
+from lrucache import LRUCache
+from parallel import generate_batches
+from SwigCaptionsV2 import SwigCaptionV2
+
+NAMES = ["man", "woman", "dog", "park", "ball", "field", "knife", "water", "tree", "child"]
+ROLES = ["agent", "item", "place", "tool", "destination", "victim", "coagent", "surface"]
+VERBS = ["pressing", "carrying", "eating", "jumping", "talking"]
+
+
+class StubWordNetTable:
+    """Names a synset after its offset and gives every noun a fixed list of hypernyms."""
+
+    def synset_name(self, offset:int):
+        return NAMES[offset % len(NAMES)]
+
+    def hypernyms(self, noun:str):
+        return [noun + " kind", "thing"] if len(noun) % 2 else []
+
+
+def stub_stats():
+    r = random.Random(0)
+    words = ["the", "a", "in", "on", "at", "with"] + NAMES
+    tags = ["DET", "ADP", "NOUN"]
+    return CorpusStats.from_tagged_words([(r.choice(words), r.choice(tags)) for _ in range(5000)])
+
+
+@pytest.fixture
+def split_file(tmp_path, monkeypatch):
+    # the pool workers are forked and inherit the loaded statistics and table
+    monkeypatch.setitem(corpusstats._loaded_stats, str(DEFAULT_STATS_FILE), stub_stats())
+    monkeypatch.setitem(wordnettable._loaded_tables, str(wordnettable.DEFAULT_WORDNET_FILE), StubWordNetTable())
+    monkeypatch.setattr(SwigCaptionsV2, "_hypernym_cache", LRUCache(100))
+
+    r = random.Random(1)
+    annotations = {}
+    for i in range(45):
+        roles = r.sample(ROLES, r.randint(1, 4))
+        annotations["img_{:03d}.jpg".format(i)] = {
+            "bb": {role: [0, 0, 10, 10] for role in roles}, "height": 512, "width": 512, "verb": r.choice(VERBS),
+            "frames": [{role: "" if r.random() < 0.1 else "n{:08d}".format(r.randint(0, 99)) for role in roles}
+                       for _ in range(3)],
+        }
+    path = tmp_path / "dev.json"
+    path.write_text(json.dumps(annotations))
+    return path
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="workers must inherit the stubs")
+@pytest.mark.parametrize("global_vocabulary", [False, True])
+def test_pool_output_matches_serial_run(split_file, global_vocabulary):
+    def run(workers):
+        capgen = SwigCaptionV2(split_file, batch_size=4, global_vocabulary=global_vocabulary)
+        return json.dumps(list(generate_batches(capgen, range(1, capgen.total_batch + 1), workers)))
+
+    serial = run(1)
+    assert json.loads(serial)
+    assert run(2) == serial
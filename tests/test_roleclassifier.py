@@ -0,0 +1,22 @@
+from interning import InternTable
+from roleclassifier import RoleClassifier, table_classifier
+
+
+def test_one_classifier_per_table():
+    table = InternTable()
+    table.encode_frame({"agent": "n1", "food": "n2"})
+    classifier = table_classifier(table)
+    assert table_classifier(table) is classifier
+    assert table_classifier(InternTable()) is not classifier
+
+    # roles interned later are classified on the next use
+    table.encode_frame({"place": "n3", "tool": ""})
+    assert table_classifier(table) is classifier
+    assert [c.name for c in classifier.classes] == table.roles.strings
+
+
+def test_select():
+    classifier = RoleClassifier(["place", "agent", "food", "tool"])
+    # subject agent, place, object the listed food
+    assert classifier.select([0, 1, 2]) == (1, 0, 2)
+    assert classifier.select([]) == (None, None, None)
@@ -0,0 +1,29 @@
+from pathlib import Path
+
+
+# cv2 is only imported to look at the data, generating and combining
+# captions never load it
+
+def draw_boxes(imgpath:Path, annotation:dict):
+    import cv2
+
+    img = cv2.imread(str(imgpath))
+
+    result = img.copy()
+    boxes = annotation['bb']
+    for bkey in boxes:
+        b = boxes[bkey]
+        cv2.rectangle(result, (b[0], b[1]), (b[2], b[3]), (0, 0, 255), 2)
+    return result
+
+
+def show_image(image):
+    import cv2
+
+    cv2.imshow("bounding_box", image)
+    cv2.waitKey(0)
+    cv2.destroyAllWindows()
+
+
+def show_img(imgpath:Path, annotation:dict):
+    show_image(draw_boxes(imgpath, annotation))
@@ -0,0 +1,198 @@
+import mmap
+import os
+import struct
+from pathlib import Path
+
+
+DEFAULT_WORDNET_FILE = Path("generated/cache/wordnet_nouns.bin")
+
+_MAGIC = b"SWIGWN01"
+_HEADER = struct.Struct("<8sIIII")
+_U32 = struct.Struct("<I")
+
+
+class WordNetTable:
+    """
+    Read only, memory mapped WordNet noun table.
+
+    It maps a noun synset offset to the trimmed synset name
+    (e.g. 10287213 -> 'man') and a formatted noun (lowercase, spaces) to the
+    formatted lemmas of the hypernyms of its first synset, which is what
+    SwigCaptionGenerator.check_synonym chooses from.
+
+    Layout (little endian uint32 unless noted):
+        header       magic, n_synsets, n_strings, n_hypernyms, pool_size
+        syn_offsets  n_synsets, sorted
+        syn_names    n_synsets, string ids
+        str_start    n_strings + 1, byte offsets into pool
+        hyp_start    n_strings + 1, ranges into hyps
+        hyps         n_hypernyms, string ids
+        hyp_flags    n_strings bytes, 1 when the string has a hypernym entry
+        pool         pool_size bytes of utf-8, strings in sorted order
+    """
+    path: Path
+    n_synsets: int
+    n_strings: int
+
+    def __init__(self, path:Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.n_synsets, self.n_strings, n_hypernyms, pool_size = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not a WordNet table file")
+
+        self._syn_offsets = _HEADER.size
+        self._syn_names = self._syn_offsets + 4 * self.n_synsets
+        self._str_start = self._syn_names + 4 * self.n_synsets
+        self._hyp_start = self._str_start + 4 * (self.n_strings + 1)
+        self._hyps = self._hyp_start + 4 * (self.n_strings + 1)
+        self._hyp_flags = self._hyps + 4 * n_hypernyms
+        self._pool = self._hyp_flags + self.n_strings
+
+    def __len__(self):
+        return self.n_synsets
+
+    def _u32(self, base:int, i:int):
+        return _U32.unpack_from(self._mm, base + 4 * i)[0]
+
+    def _string(self, string_id:int):
+        start = self._u32(self._str_start, string_id)
+        end = self._u32(self._str_start, string_id + 1)
+        return self._mm[self._pool + start:self._pool + end].decode('utf-8')
+
+    def _find_string(self, value:str):
+        lo, hi = 0, self.n_strings
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(mid) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_strings and self._string(lo) == value:
+            return lo
+        return None
+
+    def offset(self, i:int):
+        """Offset of the i-th synset of the table, in increasing offset order."""
+        return self._u32(self._syn_offsets, i)
+
+    def synset_name(self, offset:int):
+        lo, hi = 0, self.n_synsets
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._u32(self._syn_offsets, mid) < offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_synsets and self._u32(self._syn_offsets, lo) == offset:
+            return self._string(self._u32(self._syn_names, lo))
+        return None
+
+    def hypernyms(self, noun:str):
+        """
+        Returns the formatted hypernym lemmas of noun, or None when the noun
+        is not part of the table.
+        """
+        string_id = self._find_string(noun)
+        if string_id is None or self._mm[self._hyp_flags + string_id] == 0:
+            return None
+
+        start = self._u32(self._hyp_start, string_id)
+        end = self._u32(self._hyp_start, string_id + 1)
+        return [self._string(self._u32(self._hyps, i)) for i in range(start, end)]
+
+    def close(self):
+        self._mm.close()
+
+
+def format_lemma(name:str):
+    return name.split('.')[0].replace("_", " ")
+
+
+def first_synset_hypernyms(noun:str):
+    from nltk.corpus import wordnet as wn
+    synlist = wn.synsets(noun)
+    if len(synlist) == 0:
+        return []
+    return [format_lemma(h.name()) for h in synlist[0].hypernyms()]
+
+
+def build_wordnet_table(path:Path):
+    from nltk.corpus import wordnet as wn
+
+    synsets = {}
+    for s in wn.all_synsets('n'):
+        synsets[s.offset()] = s.name().split('.')[0]
+
+    hypernyms = {}
+    for name in set(synsets.values()):
+        noun = name.replace("_", " ").lower()
+        if noun not in hypernyms:
+            hypernyms[noun] = first_synset_hypernyms(noun)
+
+    strings = set(synsets.values())
+    strings.update(hypernyms.keys())
+    for h in hypernyms.values():
+        strings.update(h)
+    strings = sorted(strings)
+    string_ids = {v: i for i, v in enumerate(strings)}
+
+    offsets = sorted(synsets.keys())
+
+    pool = bytearray()
+    str_start = [0]
+    for v in strings:
+        pool += v.encode('utf-8')
+        str_start.append(len(pool))
+
+    hyp_start = [0]
+    hyps = []
+    hyp_flags = bytearray(len(strings))
+    for i, v in enumerate(strings):
+        if v in hypernyms:
+            hyp_flags[i] = 1
+            hyps.extend(string_ids[h] for h in hypernyms[v])
+        hyp_start.append(len(hyps))
+
+    def pack(values):
+        return struct.pack("<{}I".format(len(values)), *values)
+
+    path = Path(path)
+    if not os.path.exists(path.parent):
+        os.makedirs(path.parent)
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(offsets), len(strings), len(hyps), len(pool)))
+        f.write(pack(offsets))
+        f.write(pack([string_ids[synsets[o]] for o in offsets]))
+        f.write(pack(str_start))
+        f.write(pack(hyp_start))
+        f.write(pack(hyps))
+        f.write(bytes(hyp_flags))
+        f.write(bytes(pool))
+    os.replace(tmp, path)
+
+
+_loaded_tables = {}
+
+def load_wordnet_table(path:Path=DEFAULT_WORDNET_FILE):
+    """
+    Returns the table stored at path, mapping it only once per process.
+    The table is built from the NLTK WordNet corpus when the file is missing.
+    """
+    key = str(path)
+    if key not in _loaded_tables:
+        if not os.path.isfile(path):
+            build_wordnet_table(path)
+        _loaded_tables[key] = WordNetTable(path)
+
+    return _loaded_tables[key]
+
+
+if __name__ == '__main__':
+    build_wordnet_table(DEFAULT_WORDNET_FILE)
+    table = load_wordnet_table(DEFAULT_WORDNET_FILE)
+    print(f'Saved {len(table)} noun synsets to {DEFAULT_WORDNET_FILE}')